@@ -1,18 +1,50 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, send_file, jsonify, session, abort, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
-from flask_socketio import SocketIO, emit
+from werkzeug.security import safe_join
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
+from prometheus_client import CollectorRegistry, Counter as MetricCounter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+from prometheus_client import values as metric_values
+from prometheus_client.core import GaugeMetricFamily
+import io
 import os
+import re
 import base64
+import click
+import glob
+import hashlib
+try:
+    import fcntl
+except ImportError:  # Windows dev server: one process, chunk writes are not locked
+    fcntl = None
+import hmac
+import logging
+import mimetypes
+import shutil
+import signal
+import socket
+import sys
+import threading
+import uuid
 from datetime import datetime, timedelta, time as dtime  # ✅ correct alias
-from sqlalchemy.orm import joinedload
-from collections import defaultdict
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import defaultdict, OrderedDict, Counter
 from calendar import monthrange, day_name
 import calendar
-from sqlalchemy import inspect
+from sqlalchemy import inspect, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, TimeoutError as SATimeoutError
+from sqlalchemy.pool import QueuePool
+from PIL import Image, ImageOps
 import json
+from urllib.parse import quote
+from markupsafe import Markup
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
 import time as time_module  # ✅ for time.sleep() or timestamps
 from datetime import datetime, date
 from flask import send_from_directory
@@ -25,7 +57,15 @@ app.secret_key = "ims_secret"
 
 
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# SOCKETIO_ASYNC_MODE picks eventlet/gevent/threading (auto-detected when unset).
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379/0) lets several worker
+# processes, and background jobs, broadcast to each other's clients.
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=os.environ.get("SOCKETIO_ASYNC_MODE") or None,
+    message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None,
+)
 app.config["UPLOAD_FOLDER"] = os.path.join(os.getcwd(), "uploads")
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
@@ -39,26 +79,789 @@ def fromjson_filter(value):
         return value
 
 # ==========================
-# DATABASE (MySQL)
+# DATABASE (MySQL by default, configurable from the environment)
 # ==========================
-app.config['SQLALCHEMY_DATABASE_URI'] = "mysql+pymysql://root:@localhost/ims_db"
+DEFAULT_DATABASE_URL = "mysql+pymysql://root:@localhost/ims_db"
+DB_DRIVERS = {"pymysql": "pymysql", "mysqlclient": "mysqldb", "psycopg2": "psycopg2"}
+
+
+class PoolMetrics:
+    """Checkout counts and wait times for the engine's connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 0 if timed_out else 1
+            self.timeouts += 1 if timed_out else 0
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+        if timed_out:
+            DB_POOL_TIMEOUTS.inc()
+        else:
+            DB_POOL_WAIT.observe(seconds)
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_seconds_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.wait_max, 6),
+            }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(), idle=pool.checkedin())
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time_module.perf_counter()
+        try:
+            connection = super()._do_get()
+        except SATimeoutError:
+            pool_metrics.record_wait(time_module.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record_wait(time_module.perf_counter() - started)
+        return connection
+
+
+def database_url():
+    """DATABASE_URL, with the DBAPI swapped for DB_DRIVER (pymysql, mysqlclient, psycopg2) when set."""
+    url = os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL)
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    driver = os.environ.get("DB_DRIVER")
+    if driver:
+        scheme, rest = url.split("://", 1)
+        url = f"{scheme.split('+')[0]}+{DB_DRIVERS.get(driver, driver)}://{rest}"
+    return url
+
+
+def engine_options(url):
+    """Pool settings from the environment. SQLite keeps SQLAlchemy's defaults."""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        # Recycle before MySQL's wait_timeout closes idle connections server-side
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+    }
+
+
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "index"
 
+# ==========================
+# METRICS (Prometheus, /metrics)
+# ==========================
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+# (set up in gunicorn.conf.py) and /metrics merges them, so any worker can be
+# scraped. `flask run-jobs` in another container reports its job metrics the same
+# way when the directory is a volume shared with the web container (see
+# docker-compose.yml). Without it the process-local registry is served.
+# METRICS_TOKEN, when set, must be sent as "Authorization: Bearer <token>".
+app.config.setdefault("METRICS_TOKEN", os.environ.get("METRICS_TOKEN"))
+
+
+def metrics_process_id(pid=None):
+    """Name of a process's sample files: pids repeat across containers, host names do not."""
+    return f"{socket.gethostname().replace('_', '-')}-{pid or os.getpid()}"
+
+
+def remove_metrics_files(process_id):
+    """Delete a finished process's sample files, so a recreated container (new host name) doesn't leave them behind."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    multiprocess.mark_process_dead(process_id, path)
+    for stale in glob.glob(os.path.join(path, f"*_{process_id}.db")):
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    # Before any metric below is created, so every sample file carries the name
+    metric_values.ValueClass = metric_values.MultiProcessValue(metrics_process_id)
+
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+UPLOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REQUEST_LATENCY = Histogram(
+    "ims_http_request_duration_seconds", "Request latency by endpoint.", ["endpoint", "method"]
+)
+REQUESTS = MetricCounter("ims_http_requests_total", "Requests by endpoint and status.", ["endpoint", "method", "status"])
+DB_QUERIES = MetricCounter("ims_db_queries_total", "SQL statements executed, by endpoint.", ["endpoint"])
+DB_QUERY_DURATION = Histogram(
+    "ims_db_query_duration_seconds", "SQL statement duration by endpoint.", ["endpoint"], buckets=DB_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    "ims_db_pool_wait_seconds", "Time spent waiting for a pooled connection.", buckets=DB_BUCKETS
+)
+DB_POOL_TIMEOUTS = MetricCounter("ims_db_pool_timeouts_total", "Pool checkouts that timed out.")
+UPLOAD_BYTES = MetricCounter("ims_upload_bytes_total", "Uploaded bytes stored, by endpoint.", ["endpoint"])
+UPLOAD_DURATION = Histogram(
+    "ims_upload_duration_seconds", "Duration of requests that stored uploaded bytes.", ["endpoint"],
+    buckets=UPLOAD_BUCKETS
+)
+SOCKET_CONNECTIONS = Gauge(
+    "ims_socketio_connections", "Open Socket.IO connections.", multiprocess_mode="livesum"
+)
+CHAT_MESSAGES = MetricCounter("ims_chat_messages_total", "Chat messages sent, by channel.", ["channel"])
+JOB_RUNS = MetricCounter("ims_job_runs_total", "Background job runs by kind and outcome.", ["kind", "outcome"])
+JOB_DURATION = Histogram("ims_job_duration_seconds", "Background job run time by kind.", ["kind"])
+
+
+def metrics_endpoint():
+    """Endpoint label for the current request; work outside requests is "<background>"."""
+    if not has_request_context():
+        return "<background>"
+    return request.endpoint or "<unmatched>"
+
+
+def record_upload_bytes(size):
+    """Count bytes a request stored; reported per endpoint when the request ends."""
+    if has_request_context():
+        g.upload_bytes = g.get("upload_bytes", 0) + size
+
+
+class JobQueueCollector:
+    """Queued/running/failed job counts, read from the job table at scrape time."""
+
+    def collect(self):
+        family = GaugeMetricFamily("ims_jobs", "Jobs in the persistent queue by kind and status.", labels=["kind", "status"])
+        try:
+            rows = db.session.query(Job.kind, Job.status, db.func.count(Job.id)).group_by(Job.kind, Job.status).all()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Job metrics unavailable: {e}")
+            rows = []
+        for kind, status, total in rows:
+            family.add_metric([kind, status], total)
+        yield family
+
+
+# Read from the database on each scrape, so it is shared by all workers already
+job_queue_registry = CollectorRegistry()
+job_queue_registry.register(JobQueueCollector())
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time_module.perf_counter()
+    g.upload_bytes = 0
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    endpoint = metrics_endpoint()
+    seconds = time_module.perf_counter() - started
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(seconds)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    if g.get("upload_bytes"):
+        UPLOAD_BYTES.labels(endpoint).inc(g.upload_bytes)
+        UPLOAD_DURATION.labels(endpoint).observe(seconds)
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    token = app.config["METRICS_TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(401)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry) + generate_latest(job_queue_registry)
+    return body, 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+# ==========================
+# QUERY PROFILER (opt-in, per request)
+# ==========================
+# QUERY_PROFILER=dev adds X-DB-* headers to every response, prod logs one JSON line
+# per request to the "ims.query_profile" logger, off (default) keeps only the aggregate /metrics counters. Both feed the
+# per-endpoint totals on /admin/query_profile (this worker process only).
+# A statement repeated QUERY_PROFILER_REPEAT times in one request is flagged as N+1.
+app.config.setdefault("QUERY_PROFILER", os.environ.get("QUERY_PROFILER", "off"))
+app.config.setdefault("QUERY_PROFILER_REPEAT", int(os.environ.get("QUERY_PROFILER_REPEAT", 3)))
+
+query_profile_log = logging.getLogger("ims.query_profile")
+query_profile_log.setLevel(logging.INFO)
+if not query_profile_log.handlers:
+    query_profile_log.addHandler(logging.StreamHandler())
+
+SQL_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def sql_fingerprint(statement):
+    """Statement text with parameters, literals and IN lists collapsed, so N+1 repeats compare equal."""
+    sql = " ".join(statement.split())
+    sql = SQL_PARAM_RE.sub("?", sql)
+    sql = SQL_LITERAL_RE.sub("?", sql)
+    return SQL_IN_LIST_RE.sub("(?)", sql)
+
+
+class QueryProfile:
+    """Statements issued while handling one request.
+
+    rows is None once any SELECT ran on a driver that doesn't report its row count.
+    """
+
+    def __init__(self):
+        self.started = time_module.perf_counter()
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.fingerprints = Counter()
+
+    def record(self, statement, seconds, rows):
+        self.statements += 1
+        self.seconds += seconds
+        if rows is None or self.rows is None:
+            self.rows = None
+        else:
+            self.rows += rows
+        self.fingerprints[sql_fingerprint(statement)] += 1
+
+    @property
+    def duplicates(self):
+        """Statements that repeated an earlier fingerprint."""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def repeats(self, threshold):
+        """[(count, sql)] for fingerprints seen at least `threshold` times, most frequent first."""
+        return [(count, sql) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+class ProfileStats:
+    """Per-endpoint totals of request profiles."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, profile, repeats):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                "endpoint": endpoint, "requests": 0, "statements": 0, "max_statements": 0,
+                "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "row_requests": 0,
+                "n1_requests": 0, "worst_repeat": None,
+            })
+            stats["requests"] += 1
+            stats["statements"] += profile.statements
+            stats["max_statements"] = max(stats["max_statements"], profile.statements)
+            stats["seconds"] += profile.seconds
+            stats["max_seconds"] = max(stats["max_seconds"], profile.seconds)
+            if profile.rows is not None:
+                stats["rows"] += profile.rows
+                stats["row_requests"] += 1
+            if repeats:
+                stats["n1_requests"] += 1
+                if stats["worst_repeat"] is None or repeats[0][0] > stats["worst_repeat"][0]:
+                    stats["worst_repeat"] = repeats[0]
+
+    def worst(self, sort="statements", limit=50):
+        """Endpoints with per-request averages, worst first by avg statements, DB time or N+1 hits."""
+        with self._lock:
+            rows = [dict(stats) for stats in self.endpoints.values()]
+        for stats in rows:
+            stats["avg_statements"] = stats["statements"] / stats["requests"]
+            stats["avg_ms"] = stats["seconds"] * 1000 / stats["requests"]
+            stats["max_ms"] = stats["max_seconds"] * 1000
+            stats["avg_rows"] = stats["rows"] / stats["row_requests"] if stats["row_requests"] else None
+        key = {"time": "avg_ms", "n1": "n1_requests"}.get(sort, "avg_statements")
+        return sorted(rows, key=lambda stats: stats[key], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+profile_stats = ProfileStats()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time_module.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    seconds = time_module.perf_counter() - conn.info["query_started"].pop()
+    endpoint = metrics_endpoint()
+    DB_QUERIES.labels(endpoint).inc()
+    DB_QUERY_DURATION.labels(endpoint).observe(seconds)
+
+    profile = g.get("query_profile") if has_request_context() else None
+    if profile is not None:
+        # Only statements returning rows count as fetched. Buffered MySQL/PostgreSQL cursors
+        # report how many; SQLite reports -1 for SELECTs, which leaves the total unknown.
+        if cursor.description is None:
+            rows = 0
+        else:
+            rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        profile.record(statement, seconds, rows)
+
+
+@app.before_request
+def start_query_profile():
+    if app.config["QUERY_PROFILER"] in ("dev", "prod"):
+        g.query_profile = QueryProfile()
+
+
+@app.after_request
+def finish_query_profile(response):
+    profile = g.pop("query_profile", None)
+    if profile is None:
+        return response
+
+    endpoint = request.endpoint or "<unmatched>"
+    repeats = profile.repeats(app.config["QUERY_PROFILER_REPEAT"])
+    profile_stats.record(endpoint, profile, repeats)
+
+    if app.config["QUERY_PROFILER"] == "dev":
+        response.headers["X-DB-Statements"] = str(profile.statements)
+        response.headers["X-DB-Time-Ms"] = f"{profile.seconds * 1000:.2f}"
+        if profile.rows is not None:
+            response.headers["X-DB-Rows"] = str(profile.rows)
+        response.headers["X-DB-Duplicates"] = str(profile.duplicates)
+        if repeats:
+            count, sql = repeats[0]
+            response.headers["X-DB-N1"] = f"{count}x {sql[:200]}".encode("ascii", "replace").decode("ascii")
+    else:
+        line = {
+            "event": "query_profile",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "duration_ms": round((time_module.perf_counter() - profile.started) * 1000, 2),
+            "statements": profile.statements,
+            "db_ms": round(profile.seconds * 1000, 2),
+            "duplicates": profile.duplicates,
+            "n_plus_one": [{"count": count, "sql": sql} for count, sql in repeats[:3]],
+        }
+        if profile.rows is not None:
+            line["rows"] = profile.rows
+        query_profile_log.info(json.dumps(line))
+    return response
+
 # ==========================
 # UPLOADS FOLDER
 # ==========================
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "uploads")
+# STORAGE_ROOT relocates every local upload folder (default: next to app.py)
+STORAGE_ROOT = os.path.abspath(os.environ.get("STORAGE_ROOT") or os.path.dirname(__file__))
+UPLOAD_FOLDER = os.path.join(STORAGE_ROOT, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+
+# ==========================
+# FILE STORAGE (local disk or S3-compatible)
+# ==========================
+# STORAGE_BACKEND=local keeps files under the folders below, sharded into hashed
+# subdirectories. STORAGE_BACKEND=s3 stores them in S3_BUCKET (any S3-compatible
+# endpoint via S3_ENDPOINT_URL, e.g. MinIO) and downloads redirect to signed URLs.
+app.config.setdefault("STORAGE_BACKEND", os.environ.get("STORAGE_BACKEND", "local"))
+app.config.setdefault("S3_BUCKET", os.environ.get("S3_BUCKET"))
+app.config.setdefault("S3_ENDPOINT_URL", os.environ.get("S3_ENDPOINT_URL"))
+app.config.setdefault("S3_REGION", os.environ.get("S3_REGION"))
+app.config.setdefault("S3_PREFIX", os.environ.get("S3_PREFIX", ""))
+app.config.setdefault("STORAGE_URL_EXPIRES", int(os.environ.get("STORAGE_URL_EXPIRES", 300)))
+SPOOL_FOLDER = os.path.join(UPLOAD_FOLDER, ".spool")  # hashing/re-encoding scratch space, always local
+os.makedirs(SPOOL_FOLDER, exist_ok=True)
+
+
+def spool_path():
+    """Unique scratch file path for a write that is moved into storage afterwards."""
+    return os.path.join(SPOOL_FOLDER, f"{os.getpid()}-{threading.get_ident()}-{time_module.time_ns()}")
+
+
+def seekable(f):
+    """Image decoders need seek(); wrap non-seekable streams (S3 bodies) in memory."""
+    if getattr(f, "seekable", None) and f.seekable():
+        return f
+    return io.BytesIO(f.read())
+
+
+class LocalStorage:
+    """Files under root, spread over two levels of hashed subdirectories (ab/cd/<key>)."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _sharded(self, key):
+        if not key or key != os.path.basename(key) or key.startswith("."):
+            abort(404)
+        shard = hashlib.md5(key.encode()).hexdigest()
+        return os.path.join(self.root, shard[:2], shard[2:4], key)
+
+    def path(self, key):
+        """Where key lives; files from before sharding are still found at the top level."""
+        sharded = self._sharded(key)
+        flat = os.path.join(self.root, key)
+        if not os.path.exists(sharded) and os.path.isfile(flat):
+            return flat
+        return sharded
+
+    def save(self, key, source, max_bytes, digest=None):
+        """Stream source into key; returns the bytes written."""
+        tmp_path = spool_path()
+        size = stream_to_file(source, tmp_path, max_bytes, digest=digest)
+        self.put_file(tmp_path, key)
+        return size
+
+    def put_file(self, local_path, key):
+        """Move an already written local file into key."""
+        target = self._sharded(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(local_path, target)
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def iter_files(self):
+        """Yield (key, mtime, size) for every stored file."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if len(d) == 2 or dirpath != self.root]
+            for name in filenames:
+                if not name.startswith("."):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    yield name, stat.st_mtime, stat.st_size
+
+    def send(self, key, download_name=None, as_attachment=True, mimetype=None, etag=True, max_age=None):
+        if not self.exists(key):
+            abort(404)
+        offloaded = offload_response(self.path(key), download_name or key, as_attachment, mimetype)
+        if offloaded is not None:
+            return offloaded
+        # conditional=True answers If-None-Match with 304 and Range with 206
+        return send_file(
+            self.path(key), mimetype=mimetype, as_attachment=as_attachment, download_name=download_name or key,
+            conditional=True, etag=etag, max_age=max_age,
+        )
+
+
+class S3Storage:
+    """Files as objects under prefix in an S3-compatible bucket. Needs boto3."""
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None):
+        import boto3  # optional dependency, only needed for STORAGE_BACKEND=s3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def _object(self, key):
+        if not key or "/" in key:
+            abort(404)
+        return self.prefix + key
+
+    def save(self, key, source, max_bytes, digest=None):
+        # Spool locally so the size limit and digest apply before anything reaches the bucket
+        tmp_path = spool_path()
+        size = stream_to_file(source, tmp_path, max_bytes, digest=digest)
+        self.put_file(tmp_path, key)
+        return size
+
+    def put_file(self, local_path, key):
+        try:
+            self.client.upload_file(local_path, self.bucket, self._object(key))
+        finally:
+            os.remove(local_path)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object(key))["Body"]
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        return self._head(key)["ContentLength"]
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def iter_files(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"][len(self.prefix):]
+                if key and "/" not in key:
+                    yield key, obj["LastModified"].timestamp(), obj["Size"]
+
+    def url(self, key, download_name=None, as_attachment=True, mimetype=None, cache_control=None):
+        disposition = "attachment" if as_attachment else "inline"
+        params = {
+            "Bucket": self.bucket,
+            "Key": self._object(key),
+            "ResponseContentDisposition": f'{disposition}; filename="{download_name or key}"',
+        }
+        if mimetype:
+            params["ResponseContentType"] = mimetype
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=app.config["STORAGE_URL_EXPIRES"])
+
+    def send(self, key, download_name=None, as_attachment=True, mimetype=None, etag=True, max_age=None):
+        # The browser fetches the bytes from the bucket (which does its own ETag, 304 and Range
+        # handling); this worker only signs the URL
+        cache_control = f"private, max-age={max_age}" if max_age else "private, no-cache"
+        return redirect(self.url(key, download_name, as_attachment, mimetype, cache_control))
+
+
+def make_storage(namespace, local_root):
+    if app.config["STORAGE_BACKEND"] == "s3":
+        return S3Storage(
+            app.config["S3_BUCKET"],
+            prefix=f"{app.config['S3_PREFIX']}{namespace}/",
+            endpoint_url=app.config["S3_ENDPOINT_URL"],
+            region=app.config["S3_REGION"],
+        )
+    return LocalStorage(local_root)
+
+
+# Namespace -> local folder (the local backend's root, and where pre-sharding files sit)
+STORAGE_FOLDERS = {
+    "uploads": UPLOAD_FOLDER,
+    "blobs": os.path.join(UPLOAD_FOLDER, "blobs"),
+    "dar": os.path.join(STORAGE_ROOT, "static", "dar_uploads"),
+    "hte": os.path.join(STORAGE_ROOT, "uploads_hte"),
+}
+STORAGES = {namespace: make_storage(namespace, folder) for namespace, folder in STORAGE_FOLDERS.items()}
+upload_storage = STORAGES["uploads"]
+blob_storage = STORAGES["blobs"]
+dar_storage = STORAGES["dar"]
+hte_file_storage = STORAGES["hte"]
+
+
+@app.cli.command("check-file-offload")
+def check_file_offload_command():
+    """Check offload headers for each FILE_OFFLOAD mode and the in-process fallback."""
+    if not isinstance(upload_storage, LocalStorage):
+        click.echo("Uploads are not on local disk; downloads redirect to signed URLs instead.")
+        return
+    key = f"offload-check-{os.getpid()}.pdf"
+    tmp_path = spool_path()
+    with open(tmp_path, "wb") as f:
+        f.write(b"%PDF-1.4 offload check")
+    upload_storage.put_file(tmp_path, key)
+    configured = app.config["FILE_OFFLOAD"]
+    failures = 0
+    cases = [
+        ("x-accel-redirect", {}, "X-Accel-Redirect"),
+        ("x-sendfile", {}, "X-Sendfile"),
+        ("auto", {"X-Sendfile-Type": "X-Accel-Redirect"}, "X-Accel-Redirect"),
+        ("auto", {}, None),
+        ("", {}, None),
+    ]
+    try:
+        for mode, headers, expected in cases:
+            app.config["FILE_OFFLOAD"] = mode
+            with app.test_request_context("/", headers=headers):
+                response = send_stored(upload_storage, key, as_attachment=True)
+                response.direct_passthrough = False
+                body = response.get_data()
+            offloaded = {name: response.headers.get(name) for name in OFFLOAD_HEADERS.values() if name in response.headers}
+            if expected:
+                ok = list(offloaded) == [expected] and not body and "attachment" in response.headers["Content-Disposition"]
+            else:
+                ok = not offloaded and body.startswith(b"%PDF")
+            failures += not ok
+            click.echo(f"[{'ok' if ok else 'FAIL'}] FILE_OFFLOAD={mode or '(off)'} {headers or ''} -> {offloaded or f'{len(body)} bytes in-process'}")
+    finally:
+        app.config["FILE_OFFLOAD"] = configured
+        upload_storage.delete(key)
+    if failures:
+        raise click.ClickException(f"{failures} offload check(s) failed.")
+
+
+# ==========================
+# FILE SERVING (ETag, Cache-Control, 304, Range)
+# ==========================
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # content-addressed files never change under their key
+IMAGE_MAX_AGE = 24 * 3600  # timestamped captures; revalidated (304) after a day
+INLINE_MIMETYPES = ("image/", "application/pdf", "text/plain")
+
+
+def file_disposition(mimetype, as_attachment=None):
+    """?disposition=inline|attachment wins, then the route's choice, then inline for viewable types."""
+    requested = request.args.get("disposition")
+    if requested in ("inline", "attachment"):
+        return requested == "attachment"
+    if as_attachment is not None:
+        return as_attachment
+    return not mimetype.startswith(INLINE_MIMETYPES)
+
+
+# FILE_OFFLOAD hands the byte transfer of local files to the front proxy once the
+# route has done its auth checks: "x-accel-redirect" (nginx), "x-sendfile"
+# (Apache/lighttpd), or "auto" to use whatever the proxy announces in an
+# X-Sendfile-Type request header. Anything else streams from this worker. nginx:
+#     location /protected/ { internal; alias /app/; }   # alias = STORAGE_ROOT
+app.config.setdefault("FILE_OFFLOAD", os.environ.get("FILE_OFFLOAD", ""))
+app.config.setdefault("FILE_OFFLOAD_PREFIX", os.environ.get("FILE_OFFLOAD_PREFIX", "/protected"))
+OFFLOAD_HEADERS = {"x-accel-redirect": "X-Accel-Redirect", "x-sendfile": "X-Sendfile"}
+
+
+def offload_mode():
+    mode = app.config["FILE_OFFLOAD"].lower()
+    if mode == "auto":
+        mode = request.headers.get("X-Sendfile-Type", "").lower()
+    return mode if mode in OFFLOAD_HEADERS else None
+
+
+def offload_response(path, download_name, as_attachment, mimetype=None):
+    """Empty response telling the proxy which file to send, or None to stream in-process."""
+    mode = offload_mode()
+    if not mode:
+        return None
+    relative = os.path.relpath(path, STORAGE_ROOT)
+    if relative.startswith(os.pardir):
+        return None  # outside the tree the proxy location maps; stream it ourselves
+
+    response = app.response_class(mimetype=mimetype or mimetypes.guess_type(download_name)[0] or "application/octet-stream")
+    response.headers.set(
+        "Content-Disposition", "attachment" if as_attachment else "inline", filename=download_name
+    )
+    if mode == "x-accel-redirect":
+        target = app.config["FILE_OFFLOAD_PREFIX"].rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+    else:
+        target = os.path.abspath(path)
+    response.headers[OFFLOAD_HEADERS[mode]] = target
+    return response
+
+
+def send_stored(storage, key, download_name=None, as_attachment=None, etag=None, immutable=False):
+    """
+    Serve key from storage with an ETag (content hash when known, else size/mtime),
+    a private Cache-Control chosen by content type, 304s and byte ranges.
+    """
+    download_name = download_name or key
+    mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    if immutable:
+        max_age = IMMUTABLE_MAX_AGE
+    elif mimetype.startswith("image/"):
+        max_age = IMAGE_MAX_AGE
+    else:
+        max_age = None  # PDFs and documents can be replaced under the same name; always revalidate
+
+    response = storage.send(
+        key, download_name=download_name, as_attachment=file_disposition(mimetype, as_attachment),
+        mimetype=mimetype, etag=etag or True, max_age=max_age,
+    )
+    if response.status_code in (301, 302, 303, 307):
+        # Reuse the signed URL for part of its lifetime instead of re-signing on every view
+        response.cache_control.private = True
+        response.cache_control.max_age = app.config["STORAGE_URL_EXPIRES"] // 2
+        return response
+
+    response.headers["Accept-Ranges"] = "bytes"
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = immutable or None
+    else:
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = 0
+    return response
+
+
+def migrate_local_files(storage, folder):
+    """Move files sitting directly in folder (pre-sharding layout) into storage. Returns the count."""
+    moved = 0
+    if not os.path.isdir(folder):
+        return moved
+    for entry in os.scandir(folder):
+        if not entry.is_file() or entry.name.startswith("."):
+            continue
+        try:
+            if isinstance(storage, LocalStorage) and storage.root == folder:
+                storage.put_file(entry.path, entry.name)
+            else:
+                tmp_path = spool_path()
+                shutil.copyfile(entry.path, tmp_path)
+                storage.put_file(tmp_path, entry.name)
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue  # another process (a second jobs container) moved it first
+        moved += 1
+    return moved
+
+
+def migrate_all_local_files():
+    """Run migrate_local_files over every STORAGE_FOLDERS entry. Returns {namespace: moved}."""
+    return {namespace: migrate_local_files(STORAGES[namespace], folder) for namespace, folder in STORAGE_FOLDERS.items()}
+
+
+@app.cli.command("migrate-storage")
+def migrate_storage_command():
+    """Move flat upload folders into the configured storage backend (sharded disk or S3)."""
+    for namespace, moved in migrate_all_local_files().items():
+        click.echo(f"{namespace}: moved {moved} file(s)")
+
 # ==========================
 # MODELS
 # ==========================
 class User(UserMixin, db.Model):
     __tablename__ = "user"
+    __table_args__ = (
+        db.Index("ix_user_role", "role"),
+        db.Index("ix_user_hte_role", "hte_id", "role"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
@@ -104,6 +907,10 @@ class Requests(db.Model):
 
 class Endorsement(db.Model):
     __tablename__ = "endorsement"
+    __table_args__ = (
+        db.Index("ix_endorsement_file", "endorsement_file"),
+        db.Index("ix_endorsement_hte_file", "hte_endorsement_file"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     hte_id = db.Column(db.Integer, db.ForeignKey("user.id"))
@@ -115,8 +922,40 @@ class Endorsement(db.Model):
     hte_endorsement_file = db.Column(db.String(255))
     student = db.relationship("User", foreign_keys=[student_id], backref="endorsements")
     hte = db.relationship("User", foreign_keys=[hte_id])
+    # File columns hold blob keys (see ENDORSEMENT BLOB STORE); legacy rows hold plain upload names
+    endorsement_blob = db.relationship(
+        "Blob", primaryjoin="foreign(Endorsement.endorsement_file) == Blob.key", viewonly=True, lazy="joined"
+    )
+    hte_endorsement_blob = db.relationship(
+        "Blob", primaryjoin="foreign(Endorsement.hte_endorsement_file) == Blob.key", viewonly=True, lazy="joined"
+    )
+
+    @property
+    def endorsement_file_name(self):
+        return self.endorsement_blob.filename if self.endorsement_blob else self.endorsement_file
+
+    @property
+    def hte_endorsement_file_name(self):
+        return self.hte_endorsement_blob.filename if self.hte_endorsement_blob else self.hte_endorsement_file
+
+
+class Blob(db.Model):
+    """Content-addressed upload, stored once however many rows reference it."""
+    __tablename__ = "blob"
+
+    key = db.Column(db.String(80), primary_key=True)  # sha256 hex + extension
+    size = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(255))  # name it was first uploaded under, used for downloads
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
 class Attendance(db.Model):
+    __table_args__ = (
+        db.Index("ix_attendance_student_approved_ts", "student_id", "hte_approved", "timestamp"),
+        db.Index("ix_attendance_student_deleted_ts", "student_id", "is_deleted", "timestamp"),
+        db.Index("ix_attendance_file_name", "file_name"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     file_name = db.Column(db.String(255))
@@ -139,6 +978,10 @@ class Attendance(db.Model):
 
 class DailyLog(db.Model):
     __tablename__ = 'daily_log'
+    __table_args__ = (
+        db.Index("ix_daily_log_student_date", "student_id", "date"),
+        db.Index("ix_daily_log_attendance", "attendance_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -157,6 +1000,9 @@ class DailyLog(db.Model):
     student = db.relationship('User', backref=db.backref('daily_logs', lazy=True))
 class DailyAccomplishment(db.Model):
     __tablename__ = "daily_accomplishment"
+    __table_args__ = (
+        db.Index("ix_daily_accomplishment_student_date", "student_id", "date"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -164,8 +1010,36 @@ class DailyAccomplishment(db.Model):
     accomplishment = db.Column(db.Text, nullable=False)  # JSON list of filenames
 
 
+class HoursLedger(db.Model):
+    """Running hours per student, kept in step with attendance approvals and daily logs."""
+    __tablename__ = "hours_ledger"
+
+    student_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    approved_hours = db.Column(db.Float, nullable=False, default=0)  # HTE-approved attendance
+    approved_records = db.Column(db.Integer, nullable=False, default=0)
+    logged_hours = db.Column(db.Float, nullable=False, default=0)  # DailyLog.total_hours
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class MonthlyHoursLedger(db.Model):
+    """Same running totals as HoursLedger, bucketed by calendar month."""
+    __tablename__ = "monthly_hours_ledger"
+
+    student_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    approved_hours = db.Column(db.Float, nullable=False, default=0)
+    approved_records = db.Column(db.Integer, nullable=False, default=0)
+    logged_hours = db.Column(db.Float, nullable=False, default=0)
+
+
 
 class ChatMessage(db.Model):
+    __table_args__ = (
+        db.Index("ix_chat_receiver_read_role", "receiver_id", "read", "sender_role"),
+        db.Index("ix_chat_sender_receiver_ts", "sender_id", "receiver_id", "timestamp"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -181,6 +1055,48 @@ class ChatMessage(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+
+class UnreadCounter(db.Model):
+    """Unread ChatMessage count per receiver and sender role, so badges skip COUNT(*)."""
+    __tablename__ = "unread_counter"
+
+    receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    sender_role = db.Column(db.String(50), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """Background work item, claimed and run by the job workers (see BACKGROUND JOBS)."""
+    __tablename__ = "job"
+    __table_args__ = (
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)  # JSON kwargs for the handler
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+class UploadSession(db.Model):
+    """A chunked upload in progress; `received` is the byte offset the next chunk must start at."""
+    __tablename__ = "upload_session"
+
+    id = db.Column(db.String(32), primary_key=True)  # random token handed to the client
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
 class Student(db.Model):
     __tablename__ = 'student'
 
@@ -210,27 +1126,539 @@ class HTE(db.Model):
     # Relationship (one HTE can have many Students)
     students = db.relationship('Student', backref='hte', lazy=True)
 # ==========================
-# HELPER FUNCTION: Compute and Save Total Hours
+# HOURS AGGREGATION SERVICE
 # ==========================
+REQUIRED_HOURS = 600
+
+# Hours credited for one HTE-approved attendance record. Captures do not carry
+# their own hours yet, so a record without total_hours counts as one hour.
+APPROVED_HOURS = db.func.coalesce(Attendance.total_hours, 1)
+
+
+def _for_students(query, column, student_ids):
+    """Restrict a query to the given students (None means every student)."""
+    if student_ids is None:
+        return query
+    return query.filter(column.in_(list(student_ids)))
+
+
+def aggregate_student_hours(student_ids=None):
+    """
+    Total and remaining hours per student, read from the hours ledger.
+    Students without approved attendance are only included when listed in student_ids.
+    """
+    query = db.session.query(HoursLedger.student_id, HoursLedger.approved_hours).filter(
+        HoursLedger.approved_records > 0
+    )
+    totals = dict(_for_students(query, HoursLedger.student_id, student_ids).all())
+    return _hours_summary(totals, student_ids)
+
+
+def aggregate_month_buckets(student_ids=None):
+    """Approved record count and hours per student and month, newest month first."""
+    query = db.session.query(
+        MonthlyHoursLedger.student_id, MonthlyHoursLedger.year, MonthlyHoursLedger.month,
+        MonthlyHoursLedger.approved_records, MonthlyHoursLedger.approved_hours
+    ).filter(MonthlyHoursLedger.approved_records > 0)
+    query = _for_students(query, MonthlyHoursLedger.student_id, student_ids)
+    rows = query.order_by(
+        MonthlyHoursLedger.student_id, MonthlyHoursLedger.year.desc(), MonthlyHoursLedger.month.desc()
+    ).all()
+    return _month_buckets(rows)
+
+
+def scan_student_hours(student_ids=None):
+    """Same as aggregate_student_hours, but recomputed from Attendance with GROUP BY student_id."""
+    query = db.session.query(
+        Attendance.student_id, db.func.sum(APPROVED_HOURS)
+    ).filter(Attendance.hte_approved == True)
+    query = _for_students(query, Attendance.student_id, student_ids)
+    totals = dict(query.group_by(Attendance.student_id).all())
+    return _hours_summary(totals, student_ids)
+
+
+def scan_month_buckets(student_ids=None):
+    """Same as aggregate_month_buckets, but recomputed from Attendance with GROUP BY month."""
+    return _month_buckets(_approved_month_rows(student_ids))
+
+
+def _approved_month_rows(student_ids=None):
+    """(student_id, year, month, records, hours) for approved attendance, newest month first."""
+    year = db.extract("year", Attendance.timestamp)
+    month = db.extract("month", Attendance.timestamp)
+    query = db.session.query(
+        Attendance.student_id, year, month,
+        db.func.count(Attendance.id), db.func.sum(APPROVED_HOURS)
+    ).filter(Attendance.hte_approved == True)
+    query = _for_students(query, Attendance.student_id, student_ids)
+    return query.group_by(Attendance.student_id, year, month).order_by(
+        Attendance.student_id, year.desc(), month.desc()
+    ).all()
+
+
+def _hours_summary(totals, student_ids):
+    summary = {}
+    for student_id in (student_ids if student_ids is not None else totals):
+        total_hours = round(float(totals.get(student_id) or 0), 2)
+        summary[student_id] = {
+            "total_hours": total_hours,
+            "remaining_hours": round(max(REQUIRED_HOURS - total_hours, 0), 2),
+        }
+    return summary
+
+
+def _month_buckets(rows):
+    buckets = defaultdict(dict)
+    for student_id, y, m, count, hours in rows:
+        month_str = date(int(y), int(m), 1).strftime("%B %Y")
+        buckets[student_id][month_str] = {"records": count, "hours": round(float(hours or 0), 2)}
+    return dict(buckets)
+
+
+def approved_records_by_month(student_ids=None):
+    """Approved attendance records grouped by student and month, in one query."""
+    query = Attendance.query.filter(Attendance.hte_approved == True)
+    query = _for_students(query, Attendance.student_id, student_ids)
+    records = query.order_by(Attendance.student_id, Attendance.timestamp.desc()).all()
+
+    grouped = defaultdict(lambda: defaultdict(list))
+    for r in records:
+        grouped[r.student_id][r.timestamp.strftime("%B %Y")].append(r)
+    return {student_id: dict(months) for student_id, months in grouped.items()}
+
+
+def daily_logs_by_student(student_ids=None, visible_only=True):
+    """Daily logs per student (newest first), in one query."""
+    query = DailyLog.query
+    if visible_only:
+        query = query.filter(DailyLog.visible_to_admin == True)
+    query = _for_students(query, DailyLog.student_id, student_ids)
+
+    logs = defaultdict(list)
+    for log in query.order_by(DailyLog.student_id, DailyLog.date.desc()).all():
+        logs[log.student_id].append(log)
+    return dict(logs)
+
+
 def calculate_total_hours(student_id):
     """Compute total rendered hours based only on HTE-approved attendance."""
-    REQUIRED_HOURS = 600
-    attendances = Attendance.query.filter_by(
-        student_id=student_id, hte_approved=True
-    ).all()
+    return aggregate_student_hours([student_id])[student_id]["total_hours"]
 
-    total_hours = sum(a.total_hours or 0 for a in attendances)
-    remaining_hours = max(REQUIRED_HOURS - total_hours, 0)
 
-    # ✅ Save automatically to User table
-    student = User.query.get(student_id)
-    if student:
-        student.total_hours = round(total_hours, 2)
-        # If you have remaining_hours column, include this line:
-        # student.remaining_hours = round(remaining_hours, 2)
+# ==========================
+# HOURS LEDGER (incremental upkeep)
+# ==========================
+def attendance_hours(record):
+    """Hours one attendance record contributes once approved (see APPROVED_HOURS)."""
+    return record.total_hours if record.total_hours is not None else 1
+
+
+def increment_row(model, key, deltas, **insert_values):
+    """
+    Add deltas to the row of model with primary key `key`, creating it (with deltas as the
+    starting values) if it does not exist. One INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE,
+    so two requests creating the same row at once cannot both insert. Runs in the caller's
+    transaction; the row stays locked until it commits.
+    """
+    table = model.__table__
+    values = {**key, **deltas, **insert_values}
+    updates = {col: table.c[col] + delta for col, delta in deltas.items()}
+    if "updated_at" in table.c:
+        updates["updated_at"] = datetime.utcnow()
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as upsert
+        db.session.execute(upsert(table).values(values).on_duplicate_key_update(updates))
+    elif dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        db.session.execute(upsert(table).values(values).on_conflict_do_update(index_elements=list(key), set_=updates))
+    else:
+        # No native upsert: a losing INSERT rolls back to its savepoint and increments instead
+        match = [table.c[col] == value for col, value in key.items()]
+        if not db.session.execute(table.update().where(*match).values(updates)).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(values))
+            except IntegrityError:
+                db.session.execute(table.update().where(*match).values(updates))
+
+
+def apply_hours_delta(student_id, when, approved_hours=0, approved_records=0, logged_hours=0):
+    """
+    Add a change to the student's ledger rows (total and month of `when`).
+    Runs in the caller's session so it commits in the same transaction as the change itself.
+    """
+    if not (approved_hours or approved_records or logged_hours):
+        return
+
+    deltas = {"approved_hours": approved_hours, "approved_records": approved_records, "logged_hours": logged_hours}
+    targets = [
+        (HoursLedger, {"student_id": student_id}),
+        (MonthlyHoursLedger, {"student_id": student_id, "year": when.year, "month": when.month}),
+    ]
+    for model, key in targets:
+        # Increment in SQL so concurrent requests do not overwrite each other
+        increment_row(model, key, deltas)
+
+
+LEDGER_COLUMNS = ("approved_hours", "approved_records", "logged_hours")
+
+
+def expected_hours_ledger(student_ids=None):
+    """
+    Ledger values recomputed from Attendance and DailyLog, as two dicts of {column: value}:
+    totals keyed by student_id and months keyed by (student_id, year, month).
+    """
+    totals = {}
+    months = {}
+
+    def row(student_id, when=None):
+        key = student_id if when is None else (student_id, int(when[0]), int(when[1]))
+        rows = totals if when is None else months
+        if key not in rows:
+            rows[key] = dict.fromkeys(LEDGER_COLUMNS, 0)
+        return rows[key]
+
+    for student_id, y, m, count, hours in _approved_month_rows(student_ids):
+        for target in (row(student_id), row(student_id, (y, m))):
+            target["approved_records"] += count
+            target["approved_hours"] += float(hours or 0)
+
+    year = db.extract("year", DailyLog.date)
+    month = db.extract("month", DailyLog.date)
+    query = db.session.query(
+        DailyLog.student_id, year, month, db.func.sum(DailyLog.total_hours)
+    ).filter(DailyLog.date.isnot(None))
+    for student_id, y, m, hours in _for_students(query, DailyLog.student_id, student_ids).group_by(
+        DailyLog.student_id, year, month
+    ):
+        for target in (row(student_id), row(student_id, (y, m))):
+            target["logged_hours"] += float(hours or 0)
+    return totals, months
+
+
+def rebuild_hours_ledger(student_ids=None):
+    """Recompute ledger rows from Attendance and DailyLog. Caller commits."""
+    for model in (MonthlyHoursLedger, HoursLedger):
+        _for_students(model.query, model.student_id, student_ids).delete(synchronize_session=False)
+
+    totals, months = expected_hours_ledger(student_ids)
+    db.session.add_all(HoursLedger(student_id=student_id, **values) for student_id, values in totals.items())
+    db.session.add_all(
+        MonthlyHoursLedger(student_id=student_id, year=year, month=month, **values)
+        for (student_id, year, month), values in months.items()
+    )
+    db.session.flush()
+    return len(totals)
+
+
+def verify_hours_ledger():
+    """
+    Compare every ledger column, in both the total and the monthly table, with a recomputation.
+    Returns (table, key, column, ledger_value, actual_value) for each value that has drifted.
+    """
+    totals, months = expected_hours_ledger()
+    ledgers = (
+        (HoursLedger, totals, lambda r: r.student_id),
+        (MonthlyHoursLedger, months, lambda r: (r.student_id, r.year, r.month)),
+    )
+    drift = []
+    for model, expected, key_of in ledgers:
+        stored = {key_of(r): r for r in model.query}
+        for key in sorted(set(stored) | set(expected)):
+            for column in LEDGER_COLUMNS:
+                have = float(getattr(stored[key], column) or 0) if key in stored else 0.0
+                want = float(expected.get(key, {}).get(column, 0))
+                if abs(have - want) > 0.01:
+                    drift.append((model.__tablename__, key, column, have, want))
+    return drift
+
+
+@app.cli.command("hours-ledger")
+@click.option("--verify", is_flag=True, help="Only report drift, do not rewrite the ledger.")
+def hours_ledger_command(verify):
+    """Rebuild the hours ledger from attendance and daily logs, or check it for drift."""
+    migrate_schema()
+    if verify:
+        drift = verify_hours_ledger()
+        for table, key, column, have, want in drift:
+            click.echo(f"{table} {key}: {column} is {have:.2f}, recomputed {want:.2f}")
+        click.echo(f"{len(drift)} ledger value(s) drifted.")
+        if drift:
+            raise SystemExit(1)
+        return
+    count = rebuild_hours_ledger()
+    db.session.commit()
+    invalidate_fragments("attendance")
+    click.echo(f"Rebuilt hours ledger for {count} student(s).")
+
+
+# ==========================
+# BACKGROUND JOBS (persistent queue)
+# ==========================
+# JOB_MODE "thread" runs JOB_WORKERS workers inside each web process,
+# "external" leaves the queue to `flask run-jobs` processes, and "inline"
+# runs each job as soon as it is enqueued (CLI, tests).
+app.config.setdefault("JOB_MODE", os.environ.get("JOB_MODE", "thread"))
+app.config.setdefault("JOB_WORKERS", int(os.environ.get("JOB_WORKERS", 2)))
+app.config.setdefault("JOB_MAX_ATTEMPTS", int(os.environ.get("JOB_MAX_ATTEMPTS", 5)))
+app.config.setdefault("JOB_RETRY_DELAY", 30)  # seconds, doubled after every failed attempt
+app.config.setdefault("JOB_LOCK_TIMEOUT", 600)  # running jobs locked longer than this are presumed dead
+JOB_POLL_INTERVAL = 5
+# Housekeeping `flask run-jobs` enqueues by itself: kind -> seconds between runs
+PERIODIC_JOBS = {
+    "expire_upload_sessions": 3600,
+    "cleanup_orphan_files": 6 * 3600,
+}
+PERIODIC_CHECK_INTERVAL = 60
+
+JOB_HANDLERS = {}
+job_wakeup = threading.Event()
+_job_workers = []
+_job_workers_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Register fn as the handler for jobs of this kind; payload keys become its kwargs."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue_job(kind, delay=0, **payload):
+    """Persist a job and hand it to the workers. Call after committing the data it depends on."""
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        run_at=datetime.now() + timedelta(seconds=delay),
+        max_attempts=app.config["JOB_MAX_ATTEMPTS"],
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    mode = app.config["JOB_MODE"]
+    if mode == "inline" and not delay:
+        if claim_job("inline", job.id):
+            run_job(db.session.get(Job, job.id))
+    elif mode == "thread":
+        start_job_workers()
+        job_wakeup.set()
+    return job
+
+
+def claim_job(worker, job_id=None):
+    """Atomically move one due job (or job_id) from queued to running. Returns it, or None."""
+    now = datetime.now()
+    if job_id is None:
+        candidates = [row[0] for row in db.session.query(Job.id).filter(
+            Job.status == "queued", Job.run_at <= now
+        ).order_by(Job.run_at, Job.id).limit(5)]
+    else:
+        candidates = [job_id]
+
+    for candidate in candidates:
+        # Conditional UPDATE: only one worker (thread or process) wins each job
+        claimed = Job.query.filter(Job.id == candidate, Job.status == "queued").update(
+            {"status": "running", "locked_at": now, "locked_by": worker, "attempts": Job.attempts + 1},
+            synchronize_session=False,
+        )
         db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job, then mark it done, or requeue it with backoff until attempts run out."""
+    job_id, kind = job.id, job.kind
+    started = time_module.perf_counter()
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f"No handler registered for {kind!r}")
+        handler(**json.loads(job.payload or "{}"))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = f"{type(e).__name__}: {e}"[:2000]
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.finished_at = datetime.now()
+        else:
+            job.status = "queued"
+            job.run_at = datetime.now() + timedelta(seconds=app.config["JOB_RETRY_DELAY"] * 2 ** (job.attempts - 1))
+        print(f"❌ Job {job_id} ({kind}) failed, attempt {job.attempts}/{job.max_attempts}:", e)
+    else:
+        job = db.session.get(Job, job_id)
+        job.status = "done"
+        job.finished_at = datetime.now()
+        job.last_error = None
+    job.locked_at = None
+    db.session.commit()
+    JOB_RUNS.labels(kind, job.status).inc()
+    JOB_DURATION.labels(kind).observe(time_module.perf_counter() - started)
+    return job.status
+
 
-    return round(total_hours, 2)
+def requeue_stale_jobs():
+    """Give jobs whose worker died mid-run back to the queue."""
+    cutoff = datetime.now() - timedelta(seconds=app.config["JOB_LOCK_TIMEOUT"])
+    count = Job.query.filter(Job.status == "running", Job.locked_at < cutoff).update(
+        {"status": "queued", "locked_at": None, "locked_by": None}, synchronize_session=False
+    )
+    db.session.commit()
+    return count
+
+
+def work_jobs(worker, stop_when_idle=False):
+    """Worker loop: run due jobs, sleep until woken or the next poll when the queue is empty."""
+    while True:
+        job = None
+        with app.app_context():
+            try:
+                requeue_stale_jobs()
+                job = claim_job(worker)
+                if job:
+                    run_job(job)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Job worker {worker} error:", e)
+        if job:
+            continue
+        if stop_when_idle:
+            return
+        job_wakeup.wait(JOB_POLL_INTERVAL)
+        job_wakeup.clear()
+
+
+def start_job_workers(count=None):
+    """Start this process's worker pool once (lazily, so forked web workers each get their own)."""
+    with _job_workers_lock:
+        if _job_workers:
+            return
+        if socketio.async_mode == "eventlet" and app.config["JOB_MODE"] == "thread":
+            print("⚠️ JOB_MODE=thread under eventlet: CPU-bound jobs stall this worker's requests; "
+                  "use JOB_MODE=external and `flask run-jobs`")
+        for n in range(count or app.config["JOB_WORKERS"]):
+            name = f"{os.getpid()}-{n}"
+            _job_workers.append(socketio.start_background_task(work_jobs, name))
+
+
+def schedule_periodic_jobs():
+    """Enqueue each PERIODIC_JOBS kind that is not pending and last finished over its interval ago."""
+    now = datetime.now()
+    scheduled = []
+    for kind, interval in PERIODIC_JOBS.items():
+        if db.session.query(Job.id).filter(Job.kind == kind, Job.status.in_(("queued", "running"))).first():
+            continue
+        last = db.session.query(db.func.max(Job.finished_at)).filter(Job.kind == kind).scalar()
+        if last is None or last <= now - timedelta(seconds=interval):
+            enqueue_job(kind)
+            scheduled.append(kind)
+    return scheduled
+
+
+def schedule_periodic_jobs_safely():
+    with app.app_context():
+        try:
+            if schedule_periodic_jobs():
+                job_wakeup.set()
+        except Exception as e:
+            db.session.rollback()
+            print("❌ Scheduling periodic jobs failed:", e)
+
+
+@app.cli.command("run-jobs")
+@click.option("--workers", type=int, help="Concurrent workers (default JOB_WORKERS).")
+@click.option("--once", is_flag=True, help="Drain the due jobs and exit instead of polling forever.")
+def run_jobs_command(workers, once):
+    """Run background job workers in this process, and enqueue the PERIODIC_JOBS when due."""
+    # docker stop sends SIGTERM; exit through the finally below so the sample files go
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        migrate_schema()
+        # Files from before sharding, including the ones the image ships in static/dar_uploads,
+        # which docker copies into a fresh volume
+        for namespace, moved in migrate_all_local_files().items():
+            if moved:
+                print(f"📦 Moved {moved} {namespace} file(s) into storage")
+        schedule_periodic_jobs_safely()
+        if once:
+            work_jobs(f"{os.getpid()}-cli", stop_when_idle=True)
+            return
+        start_job_workers(workers)
+        while True:
+            time_module.sleep(PERIODIC_CHECK_INTERVAL)
+            schedule_periodic_jobs_safely()
+    finally:
+        remove_metrics_files(metrics_process_id())
+
+
+@app.route("/admin/jobs")
+@login_required
+def admin_jobs():
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
+
+    counts = defaultdict(dict)
+    for kind, status, total in db.session.query(Job.kind, Job.status, db.func.count(Job.id)).group_by(Job.kind, Job.status):
+        counts[kind][status] = total
+    pending = Job.query.filter(Job.status.in_(["queued", "running", "failed"])).order_by(Job.id.desc()).limit(100).all()
+    recent = Job.query.filter_by(status="done").order_by(Job.finished_at.desc()).limit(20).all()
+    return render_template(
+        "admin_jobs.html",
+        counts=counts,
+        pending=pending,
+        recent=recent,
+        job_mode=app.config["JOB_MODE"],
+        job_workers=app.config["JOB_WORKERS"],
+        kinds=sorted(JOB_HANDLERS),
+    )
+
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@login_required
+def admin_retry_job(job_id):
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
+    job = Job.query.get_or_404(job_id)
+    if job.status == "failed":
+        job.status = "queued"
+        job.attempts = 0
+        job.run_at = datetime.now()
+        db.session.commit()
+        if app.config["JOB_MODE"] == "thread":
+            start_job_workers()
+            job_wakeup.set()
+        flash(f"Job #{job.id} queued again.", "success")
+    return redirect(url_for("admin_jobs"))
+
+
+@app.route("/admin/jobs/enqueue", methods=["POST"])
+@login_required
+def admin_enqueue_job():
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
+    kind = request.form.get("kind")
+    if kind not in ("recompute_hours", "cleanup_orphan_files"):
+        flash("Unknown job.", "danger")
+    else:
+        job = enqueue_job(kind)
+        flash(f"Job #{job.id} ({kind}) queued.", "success")
+    return redirect(url_for("admin_jobs"))
+
+
+@job_handler("recompute_hours")
+def recompute_hours_job(student_ids=None):
+    """Rebuild the hours ledger (all students, or student_ids) off the request path."""
+    rebuild_hours_ledger(student_ids)
+    db.session.commit()
+    invalidate_fragments("attendance")
 
 
 # ==========================
@@ -298,12 +1726,91 @@ def from_json(value):
     except Exception:
         return []
 
+# ==========================
+# PASSWORDS (bcrypt via passlib)
+# ==========================
+# PASSWORD_BCRYPT_ROUNDS is the bcrypt cost; each step doubles the time per hash.
+# Rows still holding plaintext, or a hash made with another cost, are rehashed on
+# the next successful login. Hashing runs on at most PASSWORD_HASH_WORKERS threads
+# per process, so a burst of logins queues instead of taking every core.
+app.config.setdefault("PASSWORD_BCRYPT_ROUNDS", int(os.environ.get("PASSWORD_BCRYPT_ROUNDS", 12)))
+app.config.setdefault("PASSWORD_HASH_WORKERS", int(os.environ.get("PASSWORD_HASH_WORKERS", 2)))
+
+# passlib 1.7 logs a traceback reading bcrypt>=4.1's version; hashing is unaffected
+logging.getLogger("passlib.handlers.bcrypt").setLevel(logging.ERROR)
+
+pwd_context = None
+_hash_pool = None
+_hash_slots = None
+
+
+def init_password_hashing():
+    """(Re)build the hashing context and pool from app.config."""
+    global pwd_context, _hash_pool, _hash_slots
+    workers = app.config["PASSWORD_HASH_WORKERS"]
+    pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=app.config["PASSWORD_BCRYPT_ROUNDS"])
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False)
+    _hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+    _hash_slots = threading.BoundedSemaphore(workers)
+
+
+init_password_hashing()
+
+
+def run_hashing(fn, *args):
+    """Run a bcrypt call on the bounded pool and wait for it."""
+    if socketio.async_mode == "eventlet":
+        # Threads are green under eventlet; tpool runs the call on a real OS thread
+        from eventlet import tpool
+        with _hash_slots:
+            return tpool.execute(fn, *args)
+    return _hash_pool.submit(fn, *args).result()
+
+
+def hash_password(password):
+    return run_hashing(pwd_context.hash, password)
+
+
+def check_password(user, password):
+    """
+    Verify a login. A plaintext or outdated stored password is replaced with a
+    fresh hash on success (caller commits). A missing user still costs one hash.
+    """
+    if user is None:
+        run_hashing(pwd_context.dummy_verify)
+        return False
+    stored = user.password or ""
+    if pwd_context.identify(stored, required=False) is None:
+        # Legacy plaintext row
+        if not hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")):
+            return False
+        user.password = hash_password(password)
+        return True
+    valid, new_hash = run_hashing(pwd_context.verify_and_update, password, stored)
+    if valid and new_hash:
+        user.password = new_hash
+    return valid
+
+
+@app.cli.command("hash-passwords")
+def hash_passwords_command():
+    """Hash every password still stored in plaintext, instead of waiting for each user's next login."""
+    count = 0
+    for user in User.query.all():
+        if user.password and pwd_context.identify(user.password, required=False) is None:
+            user.password = hash_password(user.password)
+            count += 1
+    db.session.commit()
+    click.echo(f"Hashed {count} plaintext password(s).")
+
+
 # ==========================
 # LOGIN MANAGER
 # ==========================
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return load_cached_user(int(user_id))
 
 
 # ==========================
@@ -321,9 +1828,11 @@ def register():
         password = request.form["password"]
         role = request.form["role"]
 
-        user = User(name=name, username=username, password=password, role=role)
+        user = User(name=name, username=username, password=hash_password(password), role=role)
         db.session.add(user)
         db.session.commit()
+        invalidate_fragments("users")
+        invalidate_users(user.id)
         flash("Registration successful! Please login.", "success")
         return redirect(url_for("index"))
     return render_template("register.html")
@@ -335,7 +1844,8 @@ def login():
     role = request.form["role"]
 
     user = User.query.filter_by(username=username, role=role).first()
-    if user and user.password == password:
+    if check_password(user, password):
+        db.session.commit()  # keeps a rehashed password
         login_user(user, remember="remember" in request.form)
         if user.role == "admin":
             return redirect(url_for("admin_dashboard"))
@@ -354,100 +1864,274 @@ def logout():
     return redirect(url_for("index"))
 
 # ==========================
-# DASHBOARDS
+# ADMIN DASHBOARD FRAGMENT CACHE
 # ==========================
-@app.route("/admin")
-@login_required
-def admin_dashboard():
-    # Only allow admin users
-    if current_user.role != "admin":
-        return redirect(url_for("index"))
-
-    # Count unread messages for the admin
-    unread_count = ChatMessage.query.filter_by(
-        receiver_id=current_user.id, read=False
-    ).count()
+# Each admin dashboard section is rendered once and reused until the data it shows
+# changes. Keys carry the version of every data set a section reads ("users",
+# "endorsements", "attendance"); write paths bump versions with invalidate_fragments()
+# after they commit, so stale fragments are never looked up again and age out.
+# FRAGMENT_CACHE=memory keeps an LRU per process (fine for one worker), redis shares
+# fragments and versions between workers and the jobs process, off disables caching.
+# Unset picks redis when FRAGMENT_CACHE_URL (or SOCKETIO_MESSAGE_QUEUE) is configured.
+app.config.setdefault("FRAGMENT_CACHE_URL", os.environ.get("FRAGMENT_CACHE_URL") or os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
+app.config.setdefault("FRAGMENT_CACHE", os.environ.get("FRAGMENT_CACHE") or ("redis" if app.config["FRAGMENT_CACHE_URL"] else "memory"))
+app.config.setdefault("FRAGMENT_CACHE_SIZE", int(os.environ.get("FRAGMENT_CACHE_SIZE", 256)))
+app.config.setdefault("FRAGMENT_CACHE_TTL", int(os.environ.get("FRAGMENT_CACHE_TTL", 3600)))
+
+
+class LRUCache:
+    """In-process cache: bounded LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.versions = {}  # never evicted, or an old fragment could become current again
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time_module.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time_module.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def get_versions(self, names):
+        with self.lock:
+            return [self.versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self.lock:
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+
+class RedisCache:
+    """Cache shared by every worker through Redis."""
+
+    def __init__(self, url, prefix):
+        import redis  # only needed when a cache is set to redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, keys):
+        self.client.delete(*[self.prefix + key for key in keys])
+
+    def get_versions(self, names):
+        values = self.client.mget([f"{self.prefix}version:{name}" for name in names])
+        return [int(value or 0) for value in values]
+
+    def bump(self, names):
+        pipe = self.client.pipeline()
+        for name in names:
+            pipe.incr(f"{self.prefix}version:{name}")
+        pipe.execute()
+
+
+def make_cache(kind, prefix, maxsize):
+    """LRUCache for "memory", RedisCache on FRAGMENT_CACHE_URL for "redis", None for anything else."""
+    if kind == "redis":
+        return RedisCache(app.config["FRAGMENT_CACHE_URL"], prefix)
+    if kind == "memory":
+        return LRUCache(maxsize)
+    return None
+
+
+fragment_cache = make_cache(app.config["FRAGMENT_CACHE"], "ims:fragment:", app.config["FRAGMENT_CACHE_SIZE"])
+
+
+def invalidate_fragments(*sections):
+    """Mark every cached fragment built from these data sets as stale. Call after commit."""
+    if fragment_cache is None:
+        return
+    try:
+        fragment_cache.bump(sections)
+    except Exception as e:
+        print(f"⚠️ Fragment cache invalidation failed for {sections}: {e}")
 
-    # Fetch users by role
-    students = User.query.filter_by(role="student").all()
-    parents = User.query.filter_by(role="parent").all()
-    htes = User.query.filter_by(role="hte").all()
 
-    # Fetch all endorsements with their related students
-    endorsements = Endorsement.query.options(joinedload(Endorsement.student)).all()
+def cached_fragment(name, deps, render):
+    """
+    Return fragment `name` from the cache, calling render() on a miss.
+    Versions are read before render() loads any data, so a write that commits
+    meanwhile bumps past the key this fragment is stored under.
+    """
+    if fragment_cache is None:
+        return Markup(render())
+    try:
+        versions = fragment_cache.get_versions(deps)
+        key = name + ":" + ",".join(f"{dep}={version}" for dep, version in zip(deps, versions))
+        html = fragment_cache.get(key)
+    except Exception as e:
+        print(f"⚠️ Fragment cache unavailable: {e}")
+        return Markup(render())
+    if html is None:
+        html = render()
+        try:
+            fragment_cache.set(key, html, app.config["FRAGMENT_CACHE_TTL"])
+        except Exception as e:
+            print(f"⚠️ Fragment cache write failed for {name}: {e}")
+    return Markup(html)
+
+
+# Section -> (template, data sets it reads, template variables it needs)
+ADMIN_FRAGMENTS = {
+    "students": ("_admin_students.html", ("users", "attendance"), ("students", "htes", "hours_summary", "required_hours")),
+    "parents": ("_admin_parents.html", ("users",), ("parents", "students")),
+    "htes": ("_admin_htes.html", ("users",), ("htes", "students")),
+    "attendance": ("_admin_attendance.html", ("users", "attendance"), ("attendance_records_by_student", "month_buckets", "students_by_id")),
+    "endorsements": ("_admin_endorsements.html", ("users", "endorsements"), ("endorsements",)),
+}
+
+# Template variable -> loader; each runs at most once per request, and only on a miss
+ADMIN_DASHBOARD_DATA = {
+    "students": lambda data: User.query.filter_by(role="student").all(),
+    "parents": lambda data: User.query.filter_by(role="parent").all(),
+    "htes": lambda data: User.query.filter_by(role="hte").all(),
+    "students_by_id": lambda data: {s.id: s for s in data["students"]},
+    "endorsements": lambda data: Endorsement.query.options(joinedload(Endorsement.student)).all(),
+    "hours_summary": lambda data: aggregate_student_hours(),
+    "month_buckets": lambda data: aggregate_month_buckets(),
+    "attendance_records_by_student": lambda data: approved_records_by_month(),
+    "required_hours": lambda data: REQUIRED_HOURS,
+}
+
+
+class LazyData(dict):
+    """Dashboard data loaded on first access."""
+
+    def __missing__(self, name):
+        value = self[name] = ADMIN_DASHBOARD_DATA[name](self)
+        return value
 
-    # Required OJT hours
-    REQUIRED_HOURS = 600
 
-    # Compute total and remaining hours per student
-    for student in students:
-        attendances = Attendance.query.filter_by(
-            student_id=student.id, hte_approved=True
-        ).all()
+def admin_dashboard_fragments():
+    data = LazyData()
+    fragments = {}
+    for name, (template, deps, needs) in ADMIN_FRAGMENTS.items():
+        render = lambda template=template, needs=needs: render_template(template, **{n: data[n] for n in needs})
+        fragments[name] = cached_fragment(name, deps, render)
+    return fragments
 
-        # Sum hours: prioritize `hours_rendered`, fallback to 1 if no field
-        total_hours = 0
-        for a in attendances:
-            if hasattr(a, "hours_rendered") and a.hours_rendered is not None:
-                total_hours += a.hours_rendered
-            else:
-                total_hours += 1  # default to 1 hour per attendance if not specified
 
-        remaining_hours = max(REQUIRED_HOURS - total_hours, 0)
-        student.total_hours = round(total_hours, 2)
-        student.remaining_hours = round(remaining_hours, 2)
+# ==========================
+# CURRENT USER CACHE
+# ==========================
+# load_user runs on every request. The logged-in user's columns (never the password)
+# and their assigned HTE's are cached for USER_CACHE_TTL seconds and attached to the
+# request's session without a SELECT, so current_user and current_user.hte cost no
+# queries on the chat polls; default_admin_id() is cached the same way.
+# invalidate_users() drops entries after assign_hte, parent_select_student and
+# register. With the memory backend, other workers catch up within the TTL.
+app.config.setdefault("USER_CACHE", os.environ.get("USER_CACHE") or app.config["FRAGMENT_CACHE"])
+app.config.setdefault("USER_CACHE_TTL", int(os.environ.get("USER_CACHE_TTL", 30)))
+app.config.setdefault("USER_CACHE_SIZE", int(os.environ.get("USER_CACHE_SIZE", 4096)))
+USER_CACHE_COLUMNS = ("id", "name", "username", "role", "total_hours", "parent_id", "hte_id", "selected_student_id")
+
+user_cache = make_cache(app.config["USER_CACHE"], "ims:user:", app.config["USER_CACHE_SIZE"])
+
+
+def _user_cache_get(key):
+    if user_cache is None:
+        return None
+    try:
+        value = user_cache.get(key)
+    except Exception as e:
+        print(f"⚠️ User cache unavailable: {e}")
+        return None
+    return json.loads(value) if value is not None else None
 
-        # Optional: save to DB if you store total_hours/remaining_hours in User table
-        db_user = db.session.get(User, student.id)
-        if db_user:
-            db_user.total_hours = student.total_hours
-            db_user.remaining_hours = student.remaining_hours
 
-    db.session.commit()
+def _user_cache_set(key, value):
+    if user_cache is None:
+        return
+    try:
+        user_cache.set(key, json.dumps(value), app.config["USER_CACHE_TTL"])
+    except Exception as e:
+        print(f"⚠️ User cache write failed for {key}: {e}")
 
-    # Group attendance by student and month
-    from collections import defaultdict
 
-    attendance_records_by_student = {}
-    for student in students:
-        records = Attendance.query.filter_by(
-            student_id=student.id, hte_approved=True
-        ).order_by(Attendance.timestamp.desc()).all()
+def invalidate_users(*user_ids):
+    """Forget cached users (and the default admin id). Call after commit."""
+    if user_cache is None:
+        return
+    try:
+        user_cache.delete([f"user:{int(user_id)}" for user_id in user_ids] + ["admin_id"])
+    except Exception as e:
+        print(f"⚠️ User cache invalidation failed for {user_ids}: {e}")
+
+
+def attach_user(columns):
+    """User built from cached columns and added to the session as already loaded."""
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_cached_user(user_id):
+    key = f"user:{user_id}"
+    cached = _user_cache_get(key)
+    if cached is not None:
+        user = attach_user(cached["user"])
+        # Loaded state, not a change: current_user.hte needs no lazy load and nothing is flushed
+        set_committed_value(user, "hte", attach_user(cached["hte"]) if cached["hte"] else None)
+        return user
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        hte = user.hte if user.hte_id else None
+        _user_cache_set(key, {
+            "user": {name: getattr(user, name) for name in USER_CACHE_COLUMNS},
+            "hte": {name: getattr(hte, name) for name in USER_CACHE_COLUMNS} if hte else None,
+        })
+    return user
 
-        records_by_month = defaultdict(list)
-        for r in records:
-            month_str = r.timestamp.strftime("%B %Y")
-            records_by_month[month_str].append(r)
 
-        attendance_records_by_student[student.id] = dict(records_by_month)
+def default_admin_id():
+    """Id of the admin students and HTEs chat with (the first admin), or None."""
+    cached = _user_cache_get("admin_id")
+    if cached is not None:
+        return cached["id"]
+    admin_id = db.session.query(User.id).filter(User.role == "admin").order_by(User.id).limit(1).scalar()
+    _user_cache_set("admin_id", {"id": admin_id})
+    return admin_id
 
-    # Logs for students with approved attendance
-    approved_student_ids = [
-        sid[0] for sid in db.session.query(Attendance.student_id)
-        .filter(Attendance.hte_approved == True)
-        .distinct()
-        .all()
-    ]
 
-    all_logs = {
-        student.id: DailyLog.query.filter_by(student_id=student.id, visible_to_admin=True)
-        .order_by(DailyLog.date.desc())
-        .all()
-        for student in students
-        if student.id in approved_student_ids
-    }
+# ==========================
+# DASHBOARDS
+# ==========================
+@app.route("/admin")
+@login_required
+def admin_dashboard():
+    # Only allow admin users
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
 
-    # Render Admin Dashboard
-    return render_template(
-        "dashboard_admin.html",
-        students=students,
-        parents=parents,
-        htes=htes,
-        endorsements=endorsements,
-        unread_count=unread_count,
-        all_logs=all_logs,
-        attendance_records_by_student=attendance_records_by_student
-    )
+    # Sections come from the fragment cache; data is only queried for the ones that changed
+    return render_template("dashboard_admin.html", fragments=admin_dashboard_fragments())
 
 
 # ==========================
@@ -478,6 +2162,8 @@ def assign_hte():
         e.hte_id = hte.id
 
     db.session.commit()
+    invalidate_fragments("users", "endorsements")
+    invalidate_users(student.id)
     return jsonify({"success": True, "message": f"Assigned {hte.name} to {student.name}"})
 
 
@@ -566,18 +2252,14 @@ def student_dashboard():
         except (TypeError, ValueError):
             log.total_hours = 0.0
 
-    # ✅ Compute total and remaining hours safely
-    total_hours_done = round(sum(log.total_hours for log in daily_logs), 2)
+    # ✅ Compute total and remaining hours from the hours ledger
+    ledger = db.session.get(HoursLedger, current_user.id)
+    total_hours_done = round(ledger.logged_hours if ledger else 0, 2)
     remaining_hours = round(600 - total_hours_done, 2)
 
     # ✅ Unread message counts
-    unread_count = ChatMessage.query.filter_by(
-        receiver_id=current_user.id, sender_role="admin", read=False
-    ).count()
-
-    hte_unread_count = ChatMessage.query.filter_by(
-        receiver_id=current_user.id, sender_role="hte", read=False
-    ).count()
+    unread_count = count_unread(current_user.id, "admin")
+    hte_unread_count = count_unread(current_user.id, "hte")
 
     # ✅ Get list of students (optional)
     students = User.query.filter_by(role="student").all()
@@ -620,58 +2302,11 @@ def hte_dashboard():
         .all()
     )
 
-    # ✅ Get attendance
-    attendance_records = (
-        Attendance.query
-        .join(User, Attendance.student_id == User.id)
-        .filter(User.hte_id == current_user.id)
-        .options(joinedload(Attendance.student))
-        .order_by(Attendance.timestamp.asc())
-        .all()
-    )
-
-    # ✅ Smart grouping
-    grouped_attendance = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-
-    # Organize all records first by student and month
-    temp_data = defaultdict(lambda: defaultdict(list))
-
-    for record in attendance_records:
-        student_name = record.student.name or f"Student-{record.student.id}"
-        month_key = record.timestamp.strftime("%B %Y")
-        temp_data[student_name][month_key].append(record)
-
-    # Now decide: full month or week range
-    for student, months in temp_data.items():
-        for month_key, records in months.items():
-            # Determine first and last day in this month’s records
-            dates = sorted([r.timestamp.date() for r in records])
-            start_date = dates[0]
-            end_date = dates[-1]
-            total_days = (end_date - start_date).days + 1
-
-            # ✅ If attendance covers most of the month (≈25+ days), group by month
-            if total_days >= 25:
-                grouped_attendance[student][month_key]["Full Month"].extend(records)
-            else:
-                # ✅ Otherwise, group by week ranges (7-day chunks)
-                week_start = start_date
-                week_index = 1
-
-                while week_start <= end_date:
-                    week_end = min(week_start + timedelta(days=6), end_date)
-                    week_label = f"Week {week_index} ({week_start.strftime('%b %d')}–{week_end.strftime('%d')})"
-                    week_records = [r for r in records if week_start <= r.timestamp.date() <= week_end]
-                    grouped_attendance[student][month_key][week_label].extend(week_records)
-                    week_index += 1
-                    week_start = week_end + timedelta(days=1)
+    # ✅ Attendance summary (student → month → week counts); records load per bucket on expand
+    attendance_summary = hte_review_summary(current_user.id)
 
     # ✅ Count unread messages
-    unread_count = ChatMessage.query.filter_by(
-        receiver_id=current_user.id,
-        sender_role="student",
-        read=False
-    ).count()
+    unread_count = count_unread(current_user.id, "student")
 
     # ✅ Get all students assigned to this HTE for messaging
     assigned_students = User.query.filter_by(hte_id=current_user.id, role="student").all()
@@ -679,11 +2314,112 @@ def hte_dashboard():
     return render_template(
         "dashboard_hte.html",
         requests=endorsements,
-        grouped_attendance=grouped_attendance,
+        attendance_summary=attendance_summary,
         unread_count=unread_count,
         assigned_students=assigned_students
     )
 
+# ==========================
+# 🧭 HTE ATTENDANCE REVIEW (bucketed, loaded on expand)
+# ==========================
+FULL_MONTH_SPAN_DAYS = 25  # a month whose records span this many days is shown as one bucket
+
+
+def _week_of_month(day):
+    """Week 1 = days 1–7, week 2 = 8–14, …, week 5 = 29–31 (SQL CASE, portable across backends)."""
+    return db.case((day <= 7, 1), (day <= 14, 2), (day <= 21, 3), (day <= 28, 4), else_=5)
+
+
+def _bucket_bounds(year, month, week):
+    """[start, end) datetimes of a week bucket; week 0 is the whole month."""
+    last_day = monthrange(year, month)[1]
+    first = 1 if week == 0 else (week - 1) * 7 + 1
+    last = last_day if week in (0, 5) else min(week * 7, last_day)
+    start = datetime(year, month, first)
+    return start, datetime(year, month, last) + timedelta(days=1)
+
+
+def hte_review_summary(hte_id):
+    """
+    Students of an HTE with their month and week buckets, each carrying record and
+    approval counts. One GROUP BY query; no Attendance rows are loaded.
+    """
+    day = db.extract("day", Attendance.timestamp)
+    year = db.extract("year", Attendance.timestamp)
+    month = db.extract("month", Attendance.timestamp)
+    week = _week_of_month(day)
+    rows = (
+        db.session.query(
+            User.id, User.name, year, month, week,
+            db.func.count(Attendance.id),
+            db.func.sum(db.case((Attendance.hte_approved == True, 1), else_=0)),
+            db.func.min(day), db.func.max(day),
+        )
+        .join(User, Attendance.student_id == User.id)
+        .filter(User.hte_id == hte_id)
+        .group_by(User.id, User.name, year, month, week)
+        .order_by(User.name, User.id, year, month, week)
+        .all()
+    )
+
+    students = {}
+    for student_id, name, y, m, w, count, approved, first_day, last_day in rows:
+        y, m, w = int(y), int(m), int(w)
+        student = students.setdefault(student_id, {
+            "student_id": student_id,
+            "student_name": name or f"Student-{student_id}",
+            "months": {},
+        })
+        month_entry = student["months"].setdefault((y, m), {
+            "year": y, "month": m, "label": date(y, m, 1).strftime("%B %Y"),
+            "records": 0, "approved": 0, "first_day": first_day, "last_day": last_day, "buckets": [],
+        })
+        month_entry["records"] += count
+        month_entry["approved"] += int(approved or 0)
+        month_entry["first_day"] = min(month_entry["first_day"], first_day)
+        month_entry["last_day"] = max(month_entry["last_day"], last_day)
+        start, end = _bucket_bounds(y, m, w)
+        month_entry["buckets"].append({
+            "week": w,
+            "label": f"Week {w} ({start.strftime('%b %d')}–{(end - timedelta(days=1)).strftime('%d')})",
+            "records": count,
+            "approved": int(approved or 0),
+        })
+
+    for student in students.values():
+        for month_entry in student["months"].values():
+            if int(month_entry["last_day"]) - int(month_entry["first_day"]) + 1 >= FULL_MONTH_SPAN_DAYS:
+                month_entry["buckets"] = [{
+                    "week": 0, "label": "Full Month",
+                    "records": month_entry["records"], "approved": month_entry["approved"],
+                }]
+        student["months"] = list(student["months"].values())
+    return list(students.values())
+
+
+@app.route("/hte/attendance/<int:student_id>/<int:year>/<int:month>/<int:week>")
+@login_required
+def hte_attendance_bucket(student_id, year, month, week):
+    """Records of one student/month/week bucket, as a table fragment for the HTE dashboard."""
+    if current_user.role != "hte":
+        return "Access Denied", 403
+    if not (1 <= month <= 12 and 0 <= week <= 5):
+        abort(404)
+
+    student = User.query.filter_by(id=student_id, hte_id=current_user.id).first()
+    if not student:
+        return "<p class='text-danger text-center'>Student not found or not assigned to you.</p>", 404
+
+    start, end = _bucket_bounds(year, month, week)
+    records = (
+        Attendance.query
+        .filter(Attendance.student_id == student.id, Attendance.timestamp >= start, Attendance.timestamp < end)
+        .order_by(Attendance.timestamp.asc())
+        .all()
+    )
+    return render_template("_hte_attendance_bucket.html", records=records)
+
+
 # 📄 View Accomplishment Reports (HTE side)
 @app.route("/hte/accomplishment_reports/<int:hte_id>")
 @login_required
@@ -808,11 +2544,162 @@ def parent_select_student(student_id):
     # Link parent and student
     student.parent_id = current_user.id
     db.session.commit()
+    invalidate_fragments("users")
+    invalidate_users(student.id, current_user.id)
 
     flash("Child assigned successfully.", "success")
     return redirect(url_for('parent_dashboard'))
 
 
+# ==========================
+# 💬 UNREAD COUNTERS
+# ==========================
+def _bump_unread(receiver_id, sender_role, delta):
+    increment_row(UnreadCounter, {"receiver_id": receiver_id, "sender_role": sender_role}, {"unread": delta})
+
+
+def note_message_sent(msg):
+    """Count a new ChatMessage as unread for its receiver. Call before the send is committed."""
+    _bump_unread(int(msg.receiver_id), msg.sender_role, 1)
+
+
+def count_unread(receiver_id, sender_role=None):
+    """Unread messages for a receiver, optionally only those sent by one role."""
+    query = db.session.query(db.func.sum(UnreadCounter.unread)).filter(UnreadCounter.receiver_id == receiver_id)
+    if sender_role:
+        query = query.filter(UnreadCounter.sender_role == sender_role)
+    return max(int(query.scalar() or 0), 0)
+
+
+def mark_read(receiver_id, sender_role=None, sender_id=None):
+    """Mark a receiver's unread messages as read, one bulk UPDATE per sender role. Caller commits."""
+    criteria = [ChatMessage.receiver_id == receiver_id, ChatMessage.read == False]
+    if sender_id:
+        criteria.append(ChatMessage.sender_id == sender_id)
+
+    if sender_role:
+        roles = [sender_role]
+    else:
+        roles = [role for (role,) in db.session.query(ChatMessage.sender_role).filter(*criteria).distinct()]
+
+    # One UPDATE per role, decremented by the rows that UPDATE flipped: a message arriving
+    # meanwhile is either flipped and counted here, or left unread and still counted
+    flipped = 0
+    for role in roles:
+        count = ChatMessage.query.filter(*criteria, ChatMessage.sender_role == role).update(
+            {ChatMessage.read: True}, synchronize_session=False
+        )
+        if count:
+            _bump_unread(receiver_id, role, -count)
+            flipped += count
+    return flipped
+
+
+def rebuild_unread_counters():
+    """Recompute every counter from ChatMessage. Caller commits."""
+    UnreadCounter.query.delete(synchronize_session=False)
+    rows = db.session.query(
+        ChatMessage.receiver_id, ChatMessage.sender_role, db.func.count(ChatMessage.id)
+    ).filter(ChatMessage.read == False).group_by(ChatMessage.receiver_id, ChatMessage.sender_role).all()
+    db.session.add_all(
+        UnreadCounter(receiver_id=receiver_id, sender_role=role, unread=count) for receiver_id, role, count in rows
+    )
+    db.session.flush()
+    return len(rows)
+
+
+@app.cli.command("unread-counters")
+def unread_counters_command():
+    """Rebuild the unread message counters from chat messages."""
+    migrate_schema()
+    count = rebuild_unread_counters()
+    db.session.commit()
+    click.echo(f"Rebuilt {count} unread counter(s).")
+
+
+# ==========================
+# 💬 CHAT HISTORY API (keyset pagination)
+# ==========================
+CHAT_PAGE_SIZE = 50
+CHAT_PAGE_MAX = 200
+
+
+def conversation_filter(user_id, partner_id, user_role=None, partner_role=None):
+    """Messages exchanged between two users, optionally pinned to the roles they sent as."""
+    sent = (ChatMessage.sender_id == user_id) & (ChatMessage.receiver_id == partner_id)
+    received = (ChatMessage.sender_id == partner_id) & (ChatMessage.receiver_id == user_id)
+    if user_role:
+        sent = sent & (ChatMessage.sender_role == user_role)
+    if partner_role:
+        received = received & (ChatMessage.sender_role == partner_role)
+    return sent | received
+
+
+def encode_chat_cursor(message):
+    """Opaque cursor pointing at a message's (timestamp, id) position."""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_chat_cursor(cursor):
+    """Return (timestamp, id) for a cursor, or None if it is missing or malformed."""
+    try:
+        ts, msg_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(msg_id)
+    except (AttributeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def chat_page(criterion, before=None, after_id=None, limit=CHAT_PAGE_SIZE):
+    """
+    One bounded page of a conversation, oldest message first.
+
+    - before:   cursor from a previous page; returns the messages just older than it.
+    - after_id: returns messages newer than that id (what pollers ask for).
+    - neither:  returns the latest page.
+    """
+    limit = max(1, min(limit or CHAT_PAGE_SIZE, CHAT_PAGE_MAX))
+    query = ChatMessage.query.filter(criterion)
+
+    if after_id:
+        rows = query.filter(ChatMessage.id > after_id).order_by(ChatMessage.id.asc()).limit(limit + 1).all()
+        has_newer = len(rows) > limit
+        messages = rows[:limit]
+        has_older = True
+    else:
+        position = decode_chat_cursor(before) if before else None
+        if position:
+            ts, msg_id = position
+            query = query.filter(
+                (ChatMessage.timestamp < ts) | ((ChatMessage.timestamp == ts) & (ChatMessage.id < msg_id))
+            )
+        rows = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+        has_older = len(rows) > limit
+        messages = list(reversed(rows[:limit]))
+        has_newer = position is not None
+
+    return {
+        "messages": messages,
+        "older_cursor": encode_chat_cursor(messages[0]) if messages and has_older else None,
+        "has_older": bool(messages) and has_older,
+        "has_newer": has_newer,
+    }
+
+
+def chat_page_args():
+    """Read before/after_id/limit paging arguments from the query string."""
+    return {
+        "before": request.args.get("before"),
+        "after_id": request.args.get("after_id", type=int),
+        "limit": request.args.get("limit", CHAT_PAGE_SIZE, type=int),
+    }
+
+
+def chat_page_meta(page):
+    """Paging fields that accompany a page of messages in JSON responses."""
+    return {"older_cursor": page["older_cursor"], "has_older": page["has_older"], "has_newer": page["has_newer"]}
+
+
 # ==========================
 # 💬 STUDENT–ADMIN CHAT ROUTES
 # ==========================
@@ -823,24 +2710,22 @@ def student_chat():
         return redirect(url_for("index"))
 
     # ✅ Default admin is user with role="admin" (first one found)
-    admin_user = User.query.filter_by(role="admin").first()
+    admin_id = default_admin_id()
+    admin_user = db.session.get(User, admin_id) if admin_id else None
     if not admin_user:
         flash("No admin found.", "danger")
         return redirect(url_for("index"))
 
-    # ✅ Load chat messages between current student and admin
-    messages = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.receiver_id == admin_user.id)) |
-        ((ChatMessage.sender_id == admin_user.id) & (ChatMessage.receiver_id == current_user.id))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+    # ✅ Load the latest page of chat messages between current student and admin
+    page = chat_page(conversation_filter(current_user.id, admin_user.id), **chat_page_args())
 
-    # ✅ Mark all unread messages received by student as read
-    unread_msgs = ChatMessage.query.filter_by(receiver_id=current_user.id, read=False).all()
-    for msg in unread_msgs:
-        msg.read = True
+    # ✅ Mark unread admin messages received by student as read
+    mark_read(current_user.id, "admin")
     db.session.commit()
 
-    return render_template('chat.html', role='student', messages=messages, admin=admin_user)
+    return render_template(
+        'chat.html', role='student', messages=page["messages"], older_cursor=page["older_cursor"], admin=admin_user
+    )
 
 
 @app.route('/admin_chat/<int:student_id>')
@@ -851,34 +2736,37 @@ def admin_chat(student_id):
 
     student = User.query.get_or_404(student_id)
 
-    # Load messages between admin and this student
-    messages = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.receiver_id == student.id)) |
-        ((ChatMessage.sender_id == student.id) & (ChatMessage.receiver_id == current_user.id))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+    # Load the latest page of messages between admin and this student
+    page = chat_page(conversation_filter(current_user.id, student.id), **chat_page_args())
 
-    return render_template('chat.html', role='admin', student=student, messages=messages)
+    return render_template(
+        'chat.html', role='admin', student=student, messages=page["messages"], older_cursor=page["older_cursor"]
+    )
 
 # Message route
 @app.route("/admin_chat_hte/<int:hte_id>")
 @login_required
 def admin_chat_hte(hte_id):
     hte = User.query.get_or_404(hte_id)
-    return render_template("chat_admin_hte.html", hte=hte)
+    return render_template("chat_admin_hte.html", hte=hte, partner_id=hte.id)
 
 @app.route("/get_messages/<int:receiver_id>")
 @login_required
 def get_messages(receiver_id):
-    messages = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.receiver_id == receiver_id)) |
-        ((ChatMessage.sender_id == receiver_id) & (ChatMessage.receiver_id == current_user.id))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+    page = chat_page(conversation_filter(current_user.id, receiver_id), **chat_page_args())
+    # Only two people in the thread: look the partner's name up once, not per message
+    partner = db.session.get(User, receiver_id) if page["messages"] else None
+    names = {
+        current_user.id: current_user.name or current_user.username,
+        receiver_id: (partner.name or partner.username) if partner else "Unknown",
+    }
 
     # Convert messages to JSON-friendly format
     messages_data = [
         {
             "id": msg.id,
             "sender_id": msg.sender_id,
+            "sender_name": names.get(msg.sender_id, "Unknown"),
             "receiver_id": msg.receiver_id,
             "sender_role": msg.sender_role,
             "receiver_role": msg.receiver_role,
@@ -886,10 +2774,10 @@ def get_messages(receiver_id):
             "timestamp": msg.timestamp.strftime("%Y-%m-%d %H:%M"),
             "read": msg.read
         }
-        for msg in messages
+        for msg in page["messages"]
     ]
 
-    return jsonify(messages_data)
+    return jsonify(messages=messages_data, **chat_page_meta(page))
 
 # Upload Important File
 @app.route("/upload_hte_file/<int:hte_id>", methods=["POST"])
@@ -898,8 +2786,7 @@ def upload_hte_file(hte_id):
     file = request.files.get("hte_file")
     if file:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
+        upload_storage.save(filename, file.stream, app.config["ENDORSEMENT_MAX_BYTES"])
         # store filename in DB related to HTE
         hte = User.query.get(hte_id)
         hte.files = (hte.files or []) + [filename]  # assuming files stored as JSON list
@@ -927,8 +2814,7 @@ def send_admin_hte_message(hte_id):
     else:
         sender_role = "hte"
         receiver_role = "admin"
-        admin = User.query.filter_by(role="admin").first()
-        receiver_id = admin.id if admin else None
+        receiver_id = default_admin_id()
 
     if not receiver_id:
         return jsonify(success=False, message="No admin found.")
@@ -941,7 +2827,9 @@ def send_admin_hte_message(hte_id):
         content=content
     )
     db.session.add(msg)
+    note_message_sent(msg)
     db.session.commit()
+    push_chat_message(msg, sender_name=current_user.name or current_user.username)
 
     return jsonify(
         success=True,
@@ -954,26 +2842,17 @@ def send_admin_hte_message(hte_id):
 @app.route("/get_admin_hte_messages/<int:hte_id>")
 @login_required
 def get_admin_hte_messages(hte_id):
-    after_id = request.args.get("after_id", type=int)
-
     if current_user.role == "admin":
         user_id = hte_id
         partner_id = current_user.id
     else:
         user_id = current_user.id
-        admin = User.query.filter_by(role="admin").first()
-        partner_id = admin.id if admin else None
+        partner_id = default_admin_id()
 
     if not partner_id:
         return jsonify(messages=[])
 
-    query = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == user_id) & (ChatMessage.receiver_id == partner_id)) |
-        ((ChatMessage.sender_id == partner_id) & (ChatMessage.receiver_id == user_id))
-    ).order_by(ChatMessage.timestamp.asc())
-
-    if after_id:
-        query = query.filter(ChatMessage.id > after_id)
+    page = chat_page(conversation_filter(user_id, partner_id), **chat_page_args())
 
     messages = [
         {
@@ -983,10 +2862,10 @@ def get_admin_hte_messages(hte_id):
             "content": m.content,
             "timestamp": m.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
         }
-        for m in query.all()
+        for m in page["messages"]
     ]
 
-    return jsonify(messages=messages)
+    return jsonify(messages=messages, **chat_page_meta(page))
 
 # -------------------- HTE Chat page --------------------
 @app.route("/chat_hte_admin")
@@ -994,7 +2873,7 @@ def get_admin_hte_messages(hte_id):
 def chat_hte_admin():
     if current_user.role != "hte":
         return redirect(url_for("index"))
-    return render_template("chat_hte_admin.html")
+    return render_template("chat_hte_admin.html", admin_id=default_admin_id())
 
 # -------------------- HTE sends message to Admin --------------------
 @app.route("/send_hte_admin_message", methods=["POST"])
@@ -1008,19 +2887,21 @@ def send_hte_admin_message():
     if not content:
         return jsonify({"success": False, "message": "Empty message."})
 
-    admin = User.query.filter_by(role="admin").first()
-    if not admin:
+    admin_id = default_admin_id()
+    if not admin_id:
         return jsonify({"success": False, "message": "No admin found."})
 
     msg = ChatMessage(
         sender_id=current_user.id,
-        receiver_id=admin.id,
+        receiver_id=admin_id,
         sender_role="hte",
         receiver_role="admin",
         content=content
     )
     db.session.add(msg)
+    note_message_sent(msg)
     db.session.commit()
+    push_chat_message(msg, sender_name=current_user.name or current_user.username)
 
     return jsonify({
         "success": True,
@@ -1051,8 +2932,9 @@ def admin_files_hte(hte_id):
 @app.route("/download_hte_file/<path:filename>")
 @login_required
 def download_hte_file(filename):
-    upload_folder = os.path.join(app.root_path, "uploads_hte")  # adjust folder name
-    return send_from_directory(upload_folder, filename, as_attachment=True)
+    if current_user.role not in ("admin", "hte"):
+        abort(404)
+    return send_stored(hte_file_storage, filename, as_attachment=True)
 # ==========================
 # 💬 STUDENT–HTE CHAT ROUTES
 # ==========================
@@ -1063,34 +2945,36 @@ def student_hte_chat():
         return redirect(url_for("index"))
 
     # ✅ Show student ↔ HTE messages
-    messages = get_hte_messages_for_student(current_user.id)
+    messages = get_hte_messages_for_student(current_user.id, **chat_page_args())
     mark_hte_messages_as_read(current_user.id)
     return render_template('student_hte_chat.html', messages=messages)
 
 # ==========================
 # 💬 HELPER FUNCTIONS FOR HTE CHAT
 # ==========================
-def get_hte_messages_for_student(student_id):
-    return ChatMessage.query.filter(
+def get_hte_messages_for_student(student_id, **page_args):
+    return chat_page(
         ((ChatMessage.sender_id == student_id) & (ChatMessage.sender_role == "student")) |
-        ((ChatMessage.receiver_id == student_id) & (ChatMessage.sender_role == "hte"))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+        ((ChatMessage.receiver_id == student_id) & (ChatMessage.sender_role == "hte")),
+        **page_args
+    )["messages"]
 
 
 def mark_hte_messages_as_read(student_id):
-    ChatMessage.query.filter_by(receiver_id=student_id, sender_role="hte", read=False).update({"read": True})
+    mark_read(student_id, "hte")
     db.session.commit()
 
 
-def get_messages_for_hte(hte_id):
-    return ChatMessage.query.filter(
+def get_messages_for_hte(hte_id, **page_args):
+    return chat_page(
         ((ChatMessage.sender_id == hte_id) & (ChatMessage.sender_role == "hte")) |
-        ((ChatMessage.receiver_id == hte_id) & (ChatMessage.sender_role == "student"))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+        ((ChatMessage.receiver_id == hte_id) & (ChatMessage.sender_role == "student")),
+        **page_args
+    )["messages"]
 
 
 def mark_student_messages_as_read(hte_id):
-    ChatMessage.query.filter_by(receiver_id=hte_id, sender_role="student", read=False).update({"read": True})
+    mark_read(hte_id, "student")
     db.session.commit()
 
 
@@ -1103,21 +2987,11 @@ def hte_chat():
     if current_user.role != "hte":
         return redirect(url_for("index"))
 
-    # ✅ Get all messages where current HTE is sender or receiver
-    messages = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.sender_role == "hte")) |
-        ((ChatMessage.receiver_id == current_user.id) & (ChatMessage.sender_role == "student"))
-    ).order_by(ChatMessage.timestamp.asc()).all()
+    # ✅ Get the latest page of messages where current HTE is sender or receiver
+    messages = get_messages_for_hte(current_user.id, **chat_page_args())
 
     # ✅ Mark all unread student messages as read
-    unread_msgs = ChatMessage.query.filter_by(
-        receiver_id=current_user.id,
-        sender_role="student",
-        read=False
-    ).all()
-    for msg in unread_msgs:
-        msg.read = True
-    db.session.commit()
+    mark_student_messages_as_read(current_user.id)
 
     return render_template('hte_chat.html', messages=messages)
 
@@ -1157,7 +3031,9 @@ def send_hte_message():
     )
 
     db.session.add(new_message)
+    note_message_sent(new_message)
     db.session.commit()
+    push_chat_message(new_message, sender_name=current_user.name or current_user.username)
 
     return jsonify({
         "success": True,
@@ -1170,7 +3046,7 @@ def send_hte_message():
 def hte_chat_admin():
     if current_user.role != "hte":
         return redirect(url_for("index"))
-    return render_template("chat_admin_hte.html", hte=current_user)
+    return render_template("chat_admin_hte.html", hte=current_user, partner_id=default_admin_id())
 
 
 # ==========================
@@ -1182,22 +3058,10 @@ def hte_get_messages(student_id):
     if current_user.role != "hte":
         return jsonify({"success": False, "error": "Unauthorized"}), 403
 
-    # Optional: fetch only new messages after a timestamp
-    after_timestamp = request.args.get("after")
-
-    query = ChatMessage.query.filter(
-        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.sender_role == "hte") & (ChatMessage.receiver_id == student_id)) |
-        ((ChatMessage.sender_id == student_id) & (ChatMessage.sender_role == "student") & (ChatMessage.receiver_id == current_user.id))
-    ).order_by(ChatMessage.timestamp.asc())
-
-    if after_timestamp:
-        try:
-            after_dt = datetime.fromisoformat(after_timestamp)
-            query = query.filter(ChatMessage.timestamp > after_dt)
-        except:
-            pass  # ignore invalid timestamp
-
-    messages = query.all()
+    page = chat_page(
+        conversation_filter(current_user.id, student_id, user_role="hte", partner_role="student"),
+        **chat_page_args()
+    )
     messages_list = [{
         "id": m.id,
         "sender_id": m.sender_id,
@@ -1206,13 +3070,13 @@ def hte_get_messages(student_id):
         "content": m.content,
         "timestamp": m.timestamp.isoformat(),
         "sender_name": current_user.name if m.sender_role=="hte" else m.receiver.name if m.receiver else "Student"
-    } for m in messages]
+    } for m in page["messages"]]
 
     # Mark messages from student as read
-    ChatMessage.query.filter_by(receiver_id=current_user.id, sender_id=student_id, sender_role="student", read=False).update({"read": True})
+    mark_read(current_user.id, "student", sender_id=student_id)
     db.session.commit()
 
-    return jsonify({"success": True, "messages": messages_list})
+    return jsonify({"success": True, "messages": messages_list, **chat_page_meta(page)})
 
 @app.route("/hte/send_message/<int:student_id>", methods=["POST"])
 @login_required
@@ -1235,10 +3099,13 @@ def hte_send_message(student_id):
         read=False
     )
     db.session.add(new_msg)
+    note_message_sent(new_msg)
     db.session.commit()
+    push_chat_message(new_msg, sender_name=current_user.name or current_user.username)
 
     return jsonify({
         "success": True,
+        "message_id": new_msg.id,
         "message": new_msg.content,
         "timestamp": new_msg.timestamp.isoformat()
     })
@@ -1268,7 +3135,9 @@ def send_message_to_student(student_id):
         read=False
     )
     db.session.add(new_msg)
+    note_message_sent(new_msg)
     db.session.commit()
+    push_chat_message(new_msg, sender_name=current_user.name or current_user.username)
 
     return jsonify({"success": True, "content": new_msg.content, "timestamp": new_msg.timestamp.strftime("%b %d, %I:%M %p")})
 
@@ -1302,9 +3171,55 @@ def send_message():
         read=False
     )
     db.session.add(new_message)
+    note_message_sent(new_message)
     db.session.commit()
+    push_chat_message(new_message, sender_name=current_user.name or current_user.username)
 
-    return jsonify({"success": True, "message": "Message sent!"})
+    return jsonify({
+        "success": True,
+        "message": "Message sent!",
+        "message_id": new_message.id,
+        "timestamp": new_message.timestamp.strftime("%Y-%m-%d %H:%M")
+    })
+
+
+# ==========================
+# ADMIN DB POOL STATUS
+# ==========================
+@app.route("/admin/db_pool")
+@login_required
+def admin_db_pool():
+    if current_user.role != "admin":
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+    return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+
+# ==========================
+# ADMIN QUERY PROFILE
+# ==========================
+@app.route("/admin/query_profile")
+@login_required
+def admin_query_profile():
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
+    sort = request.args.get("sort", "statements")
+    return render_template(
+        "admin_query_profile.html",
+        endpoints=profile_stats.worst(sort),
+        sort=sort,
+        mode=app.config["QUERY_PROFILER"],
+        repeat_threshold=app.config["QUERY_PROFILER_REPEAT"],
+    )
+
+
+@app.route("/admin/query_profile/reset", methods=["POST"])
+@login_required
+def admin_reset_query_profile():
+    if current_user.role != "admin":
+        return redirect(url_for("index"))
+    profile_stats.reset()
+    flash("Query profile reset.", "info")
+    return redirect(url_for("admin_query_profile"))
 
 
 # ==========================
@@ -1329,27 +3244,8 @@ def view_students():
     if current_user.role != "admin":
         return redirect(url_for("student_dashboard"))
 
-    # ✅ Get all students
-    students = User.query.filter_by(role="student").all()
-
-    # ✅ Load computed total & remaining hours for each student
-    for s in students:
-        s.total_hours = calculate_total_hours(s.id)
-        s.remaining_hours = max(0, 600 - s.total_hours)
-
-    # ✅ Fetch logs (optional, for dashboard)
-    all_logs = {
-        student.id: DailyLog.query.filter_by(student_id=student.id)
-        .order_by(DailyLog.date.desc())
-        .all()
-        for student in students
-    }
-
-    return render_template(
-        "dashboard_admin.html",
-        students=students,
-        all_logs=all_logs
-    )
+    # ✅ Same page as the admin dashboard, served from the same fragment cache
+    return render_template("dashboard_admin.html", fragments=admin_dashboard_fragments())
 
 @app.route("/admin/attendance/<int:student_id>")
 @login_required
@@ -1480,17 +3376,126 @@ def video_call(student_id):
     if current_user.role not in ["admin", "hte"]:
         return redirect(url_for("index"))
 
-    student = User.query.get_or_404(student_id)
-    return render_template("video_call.html", student=student)
+    student = User.query.get_or_404(student_id)
+    return render_template("video_call.html", student=student)
+
+@app.route("/admin/view_dar/<int:user_id>")
+@login_required
+def admin_view_dar(user_id):
+    # Fetch the student
+    student = User.query.get_or_404(user_id)
+    # Fetch DAR uploads for that student (adjust table name)
+    dar_records = DailyAccomplishment.query.filter_by(student_id=user_id).all()
+    return render_template("admin_view_dar.html", student=student, dar_records=dar_records)
+
+# ==========================
+# ENDORSEMENT BLOB STORE (content-addressed, reference counted)
+# ==========================
+app.config.setdefault("ENDORSEMENT_MAX_BYTES", 20 * 1024 * 1024)
+BLOB_KEY_RE = re.compile(r"[0-9a-f]{64}\.[a-z0-9]{1,10}")
+
+
+def is_blob_key(name):
+    return bool(name) and BLOB_KEY_RE.fullmatch(name) is not None
+
+
+def store_blob(source, filename, max_bytes=None):
+    """
+    Spool source locally while hashing it and return the blob key, adding one reference.
+    Content that is already stored is not written to blob_storage twice. Caller commits.
+    """
+    digest = hashlib.sha256()
+    tmp_path = spool_path()
+    size = stream_to_file(source, tmp_path, max_bytes or app.config["ENDORSEMENT_MAX_BYTES"], digest=digest)
+
+    extension = os.path.splitext(secure_filename(filename))[1].lower().lstrip(".") or "bin"
+    key = f"{digest.hexdigest()}.{extension}"
+    # Reference first: the upsert keeps the row locked until commit, so collect_blobs_job
+    # (which deletes the row before the bytes) can no longer remove what is checked below
+    increment_row(Blob, {"key": key}, {"refcount": 1}, size=size, filename=secure_filename(filename))
+    if blob_storage.exists(key):
+        os.remove(tmp_path)
+    else:
+        blob_storage.put_file(tmp_path, key)
+    return key
+
+
+def release_blob(key):
+    """Drop one reference; the bytes are removed by a job once nothing references them. Caller commits."""
+    Blob.query.filter(Blob.key == key, Blob.refcount > 0).update(
+        {"refcount": Blob.refcount - 1}, synchronize_session=False
+    )
+
+
+def replace_endorsement_file(endorsement, attr, upload):
+    """Store upload as endorsement.<attr>, releasing whatever blob the column pointed at before."""
+    previous = getattr(endorsement, attr)
+    setattr(endorsement, attr, store_blob(upload.stream, upload.filename))
+    if is_blob_key(previous):
+        release_blob(previous)
+    return getattr(endorsement, attr)
+
+
+def release_endorsement_files(endorsement):
+    """Release an endorsement's blobs and return its legacy (non-blob) upload names."""
+    legacy = []
+    for name in (endorsement.endorsement_file, endorsement.hte_endorsement_file):
+        if is_blob_key(name):
+            release_blob(name)
+        elif name:
+            legacy.append(name)
+    return legacy
+
+
+@job_handler("collect_blobs")
+def collect_blobs_job():
+    """Delete blobs whose reference count has dropped to zero, and stored bytes no blob row owns."""
+    # Bytes left by a store_blob whose transaction rolled back: adopt them as unreferenced
+    # rows so they go through the same locked delete below
+    known = {key for (key,) in db.session.query(Blob.key)}
+    cutoff = time_module.time() - ORPHAN_GRACE_SECONDS
+    for key, mtime, size in list(blob_storage.iter_files()):
+        if key not in known and is_blob_key(key) and mtime < cutoff:
+            increment_row(Blob, {"key": key}, {"refcount": 0}, size=size)
+    db.session.commit()
+
+    keys = [key for (key,) in db.session.query(Blob.key).filter(Blob.refcount <= 0)]
+    for key in keys:
+        # Re-check in the DELETE itself so a blob re-referenced meanwhile keeps its bytes. The
+        # row stays locked until the commit, after the bytes are gone, so a store_blob of the
+        # same content waits for it and then writes the bytes again
+        if Blob.query.filter(Blob.key == key, Blob.refcount <= 0).delete(synchronize_session=False):
+            blob_storage.delete(key)
+        db.session.commit()
+
+
+@app.cli.command("dedupe-endorsements")
+def dedupe_endorsements_command():
+    """Move legacy endorsement uploads into the blob store, keeping one copy of identical files."""
+    migrate_schema()
+    moved, freed, missing = 0, 0, 0
+    legacy_files = set()
+    for endorsement in Endorsement.query.all():
+        for attr in ("endorsement_file", "hte_endorsement_file"):
+            name = getattr(endorsement, attr)
+            if not name or is_blob_key(name):
+                continue
+            if not upload_storage.exists(name):
+                missing += 1
+                continue
+            with closing(upload_storage.open(name)) as f:
+                setattr(endorsement, attr, store_blob(f, name))
+            legacy_files.add(name)
+            moved += 1
+    db.session.commit()
+    invalidate_fragments("endorsements")
+    for name in legacy_files:
+        freed += upload_storage.size(name)
+        upload_storage.delete(name)
+    stored = db.session.query(db.func.coalesce(db.func.sum(Blob.size), 0)).scalar()
+    click.echo(f"Moved {moved} reference(s) into the blob store, {missing} file(s) missing.")
+    click.echo(f"Removed {freed / 1024:.0f} KB of legacy copies; blob store now holds {stored / 1024:.0f} KB.")
 
-@app.route("/admin/view_dar/<int:user_id>")
-@login_required
-def admin_view_dar(user_id):
-    # Fetch the student
-    student = User.query.get_or_404(user_id)
-    # Fetch DAR uploads for that student (adjust table name)
-    dar_records = DailyAccomplishment.query.filter_by(student_id=user_id).all()
-    return render_template("admin_view_dar.html", student=student, dar_records=dar_records)
 
 # ==========================
 # DELETE ENDORSEMENT
@@ -1502,14 +3507,14 @@ def delete_endorsement(req_id):
         return redirect(url_for("index"))
 
     endorsement = Endorsement.query.get_or_404(req_id)
-    for file_attr in ["endorsement_file", "hte_endorsement_file"]:
-        file_name = getattr(endorsement, file_attr)
-        if file_name:
-            file_path = os.path.join(UPLOAD_FOLDER, file_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+    legacy_files = release_endorsement_files(endorsement)
     db.session.delete(endorsement)
     db.session.commit()
+    invalidate_fragments("endorsements")
+    # Unreferenced bytes are removed by background jobs
+    enqueue_job("collect_blobs")
+    if legacy_files:
+        enqueue_job("delete_uploads", filenames=legacy_files)
     flash("Endorsement deleted successfully!", "success")
     return redirect(url_for("admin_dashboard"))
 
@@ -1527,16 +3532,14 @@ def student_delete_endorsement(req_id):
         flash("Unauthorized action!", "danger")
         return redirect(url_for("student_dashboard"))
 
-    # Delete associated files if exist
-    for file_attr in ["endorsement_file", "hte_endorsement_file"]:
-        file_name = getattr(endorsement, file_attr)
-        if file_name:
-            file_path = os.path.join(UPLOAD_FOLDER, file_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
+    legacy_files = release_endorsement_files(endorsement)
     db.session.delete(endorsement)
     db.session.commit()
+    invalidate_fragments("endorsements")
+    # Delete unreferenced files in the background
+    enqueue_job("collect_blobs")
+    if legacy_files:
+        enqueue_job("delete_uploads", filenames=legacy_files)
     flash("Endorsement deleted successfully!", "success")
     return redirect(url_for("student_dashboard"))
 
@@ -1567,6 +3570,8 @@ def student_endorsement():
     )
     db.session.add(endorsement)
     db.session.commit()
+    invalidate_fragments("endorsements")
+    notify_endorsement(endorsement, [endorsement.hte_id])
     flash("Endorsement request submitted to your assigned HTE!", "success")
     return redirect(url_for("student_dashboard"))
 
@@ -1584,14 +3589,18 @@ def admin_endorsement(req_id):
     file = request.files.get("endorsement_file")
     admin_comment = request.form.get("admin_comment")
     if file:
-        filename = f"admin_{req_id}_{secure_filename(file.filename)}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        endorsement.endorsement_file = filename
+        try:
+            replace_endorsement_file(endorsement, "endorsement_file", file)
+        except UploadTooLarge as e:
+            db.session.rollback()
+            flash(str(e), "danger")
+            return redirect(url_for("admin_dashboard"))
     if admin_comment:
         endorsement.admin_comment = admin_comment
     endorsement.status = "For Student"
     db.session.commit()
+    invalidate_fragments("endorsements")
+    notify_endorsement(endorsement, [endorsement.student_id])
     flash("Endorsement sent to student!", "success")
     return redirect(url_for("admin_dashboard"))
 
@@ -1616,17 +3625,15 @@ def send_to_hte(req_id):
         return jsonify({"success": False, "error": "No file uploaded"}), 400
 
     try:
-        filename = f"to_hte_{req_id}_{secure_filename(file.filename)}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-
-        endorsement.endorsement_file = filename
+        filename = replace_endorsement_file(endorsement, "endorsement_file", file)
         endorsement.status = "For HTE"
         db.session.commit()
+        invalidate_fragments("endorsements")
+        notify_endorsement(endorsement, [endorsement.hte_id])
 
         return jsonify({
             "success": True,
-            "file_name": filename,
+            "file_name": secure_filename(file.filename),
             "file_url": url_for("download_file", filename=filename),
             "status": endorsement.status
         })
@@ -1654,13 +3661,11 @@ def send_ht_file_to_admin(req_id):
         return redirect(url_for("student_dashboard"))
 
     try:
-        filename = f"to_admin_{req_id}_{secure_filename(file.filename)}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-
-        endorsement.hte_endorsement_file = filename
+        replace_endorsement_file(endorsement, "hte_endorsement_file", file)
         endorsement.status = "Approved"
         db.session.commit()
+        invalidate_fragments("endorsements")
+        notify_endorsement(endorsement, admin_ids())
 
         flash("File sent to Admin successfully!", "success")
     except Exception as e:
@@ -1688,17 +3693,15 @@ def hte_upload_endorsement(req_id):
         return jsonify({"error": "No file uploaded"}), 400
 
     try:
-        filename = f"hte_{req_id}_{secure_filename(file.filename)}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-
-        endorsement.hte_endorsement_file = filename
+        filename = replace_endorsement_file(endorsement, "hte_endorsement_file", file)
         endorsement.status = "Approved"
         db.session.commit()
+        invalidate_fragments("endorsements")
+        notify_endorsement(endorsement, [endorsement.student_id])
 
         return jsonify({
             "success": True,
-            "file_name": filename,
+            "file_name": secure_filename(file.filename),
             "file_url": url_for("download_file", filename=filename),
             "status": endorsement.status
         })
@@ -1718,11 +3721,18 @@ def hte_mark_attendance(record_id):
     try:
         record = Attendance.query.get_or_404(record_id)
         data = request.get_json()
-
-        # ✅ Update attendance presence & approval
-        record.present = bool(data.get("present", False))
-        record.hte_approved = record.present  # automatically approve if marked present
+        present = bool(data.get("present", False))  # automatically approve if marked present
+
+        # ✅ Update attendance presence & approval; the hours ledger (same transaction)
+        # only moves if this request is the one that flipped the approval
+        sign = 1 if present else -1
+        for flipped in set_attendance_approval([record.id], present):
+            apply_hours_delta(
+                flipped.student_id, flipped.timestamp,
+                approved_hours=sign * attendance_hours(flipped), approved_records=sign
+            )
         db.session.commit()
+        invalidate_fragments("attendance")
 
         # ✅ Handle DailyLog creation or visibility
         existing_log = DailyLog.query.filter_by(attendance_id=record.id).first()
@@ -1763,6 +3773,141 @@ def hte_mark_attendance(record_id):
             "error": str(e)
         }), 500
 
+# ==========================
+# HTE BULK MARK ATTENDANCE (AJAX)
+# ==========================
+def set_attendance_approval(record_ids, present):
+    """
+    Set present/hte_approved on record_ids and return the rows whose approval this call
+    changed, as (id, student_id, timestamp, total_hours). The change is decided by the
+    UPDATE itself (or under row locks), so of two concurrent reviews only one gets a row
+    back and the ledger delta is applied once.
+    """
+    flips = db.func.coalesce(Attendance.hte_approved, False) != present
+    columns = (Attendance.id, Attendance.student_id, Attendance.timestamp, Attendance.total_hours)
+    values = {Attendance.present: present, Attendance.hte_approved: present}
+    if db.session.get_bind().dialect.update_returning:
+        flipped = db.session.execute(
+            db.update(Attendance).where(Attendance.id.in_(record_ids), flips).values(values).returning(*columns),
+            execution_options={"synchronize_session": False},
+        ).all()
+    else:
+        # No UPDATE ... RETURNING (MySQL): lock the rows first, a concurrent review waits and then sees them flipped
+        flipped = db.session.query(*columns).filter(Attendance.id.in_(record_ids), flips).with_for_update().all()
+    # Everything else (and `present` on rows whose approval already matched) without touching the ledger
+    Attendance.query.filter(Attendance.id.in_(record_ids)).update(values, synchronize_session=False)
+    return flipped
+
+
+def review_attendance(records, present):
+    """
+    Approve (present=True) or reject a batch of attendance rows in the current transaction:
+    two UPDATEs for the records (see set_attendance_approval), one for existing DailyLogs, one batch insert for missing
+    DailyLogs, and one ledger update per affected student and month. Caller commits.
+    Returns {record_id: "approved" | "rejected" | "unchanged"}.
+    """
+    if not records:
+        return {}
+    record_ids = [r.id for r in records]
+    flipped = set_attendance_approval(record_ids, present)
+
+    # ✅ DailyLog upsert: flip visibility on existing logs, create the missing ones when approving
+    logged = {
+        attendance_id for (attendance_id,) in
+        db.session.query(DailyLog.attendance_id).filter(DailyLog.attendance_id.in_(record_ids))
+    }
+    if logged:
+        DailyLog.query.filter(DailyLog.attendance_id.in_(logged)).update(
+            {DailyLog.visible_to_admin: present}, synchronize_session=False
+        )
+    if present:
+        db.session.add_all([
+            DailyLog(
+                student_id=r.student_id,
+                attendance_id=r.id,
+                date=r.timestamp.date(),
+                time=r.timestamp.time(),
+                description="Marked Present by HTE ✅",
+                visible_to_admin=True,
+            )
+            for r in records if r.id not in logged
+        ])
+
+    # ✅ Hours ledger: one delta per student and month for the records this call flipped
+    sign = 1 if present else -1
+    deltas = defaultdict(lambda: [0.0, 0])
+    results = {r.id: "unchanged" for r in records}
+    for r in flipped:
+        results[r.id] = "approved" if present else "rejected"
+        delta = deltas[(r.student_id, r.timestamp.year, r.timestamp.month)]
+        delta[0] += attendance_hours(r)
+        delta[1] += 1
+    for (student_id, year, month), (hours, count) in deltas.items():
+        apply_hours_delta(
+            student_id, date(year, month, 1), approved_hours=sign * hours, approved_records=sign * count
+        )
+    return results
+
+
+@app.route("/hte/mark_attendance/bulk", methods=["POST"])
+@login_required
+def hte_mark_attendance_bulk():
+    """
+    Approve or reject many records at once. JSON body:
+      {"present": true, "record_ids": [1, 2, 3]}
+    or
+      {"present": true, "student_id": 7, "start": "2025-10-01", "end": "2025-10-07"}
+    Only records of students assigned to the current HTE are touched.
+    """
+    if current_user.role != "hte":
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+
+    data = request.get_json(silent=True) or {}
+    present = bool(data.get("present", False))
+
+    query = (
+        db.session.query(
+            Attendance.id, Attendance.student_id, Attendance.timestamp,
+            Attendance.total_hours, Attendance.hte_approved
+        )
+        .join(User, Attendance.student_id == User.id)
+        .filter(User.hte_id == current_user.id)
+    )
+    requested_ids = []
+    try:
+        if data.get("record_ids"):
+            requested_ids = [int(record_id) for record_id in data["record_ids"]]
+            query = query.filter(Attendance.id.in_(requested_ids))
+        elif data.get("student_id") and data.get("start") and data.get("end"):
+            start = datetime.strptime(data["start"], "%Y-%m-%d")
+            end = datetime.strptime(data["end"], "%Y-%m-%d") + timedelta(days=1)
+            query = query.filter(
+                Attendance.student_id == int(data["student_id"]),
+                Attendance.timestamp >= start, Attendance.timestamp < end
+            )
+        else:
+            return jsonify({"success": False, "message": "Send record_ids or student_id with start and end."}), 400
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Invalid record ids or dates."}), 400
+
+    try:
+        records = query.all()
+        results = {record_id: "not_found" for record_id in requested_ids}
+        results.update(review_attendance(records, present))
+        db.session.commit()
+        invalidate_fragments("attendance")
+    except Exception as e:
+        db.session.rollback()
+        print("❌ Error in hte_mark_attendance_bulk:", e)
+        return jsonify({"success": False, "message": "Attendance update failed.", "error": str(e)}), 500
+
+    return jsonify({
+        "success": True,
+        "message": f"Updated {len(records)} attendance record(s).",
+        "results": {str(record_id): outcome for record_id, outcome in results.items()},
+    })
+
+
 # ==========================
 # STUDENT ATTENDANCE (AJAX)
 # ==========================
@@ -1821,6 +3966,7 @@ def view_attendance_calendar(student_id):
 @app.route("/student/attendance", methods=["POST"])
 @login_required
 def student_attendance():
+    """JSON/base64 capture endpoint, kept for clients that predate /student/attendance/capture."""
     if current_user.role != "student":
         return jsonify(success=False, error="Unauthorized"), 403
 
@@ -1830,32 +3976,116 @@ def student_attendance():
         return jsonify(success=False, error="No image data received")
 
     # ⚡ Decode base64 image
-    import base64, re
     img_str = re.sub('^data:image/.+;base64,', '', img_data)
     img_bytes = base64.b64decode(img_str)
 
     # ⚡ Save image file
-    from datetime import datetime
-    import os
-    filename = f"attendance_{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-    upload_folder = os.path.join("uploads")
-    os.makedirs(upload_folder, exist_ok=True)
-    file_path = os.path.join(upload_folder, filename)
-    with open(file_path, "wb") as f:
-        f.write(img_bytes)
+    filename = attendance_capture_filename(".png")
+    try:
+        upload_storage.save(filename, io.BytesIO(img_bytes), app.config["ATTENDANCE_MAX_BYTES"])
+    except UploadTooLarge as e:
+        return jsonify(success=False, error=str(e)), 413
+
+    return save_attendance_capture(filename)
 
+
+# ==========================
+# ATTENDANCE CAPTURE UPLOAD (streaming)
+# ==========================
+app.config.setdefault("ATTENDANCE_MAX_BYTES", 5 * 1024 * 1024)
+CAPTURE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def stream_to_file(source, path, max_bytes, chunk_size=STREAM_CHUNK_SIZE, digest=None):
+    """
+    Copy a readable stream to path chunk by chunk, feeding digest (a hashlib object) if given.
+    The partial file is removed on any error.
+    """
+    written = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes.")
+                if digest is not None:
+                    digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    record_upload_bytes(written)
+    return written
+
+
+def attendance_capture_filename(extension):
+    # Random suffix: two captures in the same second (and their re-encoded copies) never share a file
+    return f"attendance_{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}{extension}"
+
+
+@app.route("/student/attendance/capture", methods=["POST"])
+@login_required
+def student_attendance_capture():
+    """
+    Capture upload as a raw image body (Content-Type: image/png|jpeg|webp) or as the
+    `attendance_file` part of a multipart form. The bytes are streamed to disk, never
+    held in memory whole, and rejected past ATTENDANCE_MAX_BYTES.
+    """
+    if current_user.role != "student":
+        return jsonify(success=False, error="Unauthorized"), 403
+
+    max_bytes = app.config["ATTENDANCE_MAX_BYTES"]
+    if request.content_length and request.content_length > max_bytes + STREAM_CHUNK_SIZE:
+        return jsonify(success=False, error="Image is too large."), 413
+
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("attendance_file")
+        if not upload:
+            return jsonify(success=False, error="No image data received"), 400
+        source, mimetype = upload.stream, upload.mimetype
+    else:
+        source, mimetype = request.stream, request.mimetype
+
+    extension = CAPTURE_EXTENSIONS.get(mimetype)
+    if not extension:
+        return jsonify(success=False, error="Unsupported image type."), 415
+
+    filename = attendance_capture_filename(extension)
+    try:
+        written = upload_storage.save(filename, source, max_bytes)
+    except UploadTooLarge as e:
+        return jsonify(success=False, error=str(e)), 413
+    if not written:
+        upload_storage.delete(filename)
+        return jsonify(success=False, error="No image data received"), 400
+
+    return save_attendance_capture(filename)
+
+
+def save_attendance_capture(filename):
+    """Record a saved capture as Attendance and fill the next DailyLog slot for today."""
     # ⚡ Create Attendance record
-    from datetime import date, datetime as dt
+    now_dt = datetime.now()
     attendance_record = Attendance(
         student_id=current_user.id,
         file_name=filename,
-        timestamp=dt.now()
+        date=now_dt.date(),
+        timestamp=now_dt
     )
     db.session.add(attendance_record)
 
     # ⚡ Update DailyLog automatically
-    today = date.today()
-    now = dt.now().time()
+    today = now_dt.date()
+    now = now_dt.time()
     daily_log = DailyLog.query.filter_by(student_id=current_user.id, date=today).first()
 
     if not daily_log:
@@ -1888,19 +4118,126 @@ def student_attendance():
         if daily_log.in_am and daily_log.out_pm:
             t1 = datetime.combine(today, daily_log.in_am)
             t2 = datetime.combine(today, daily_log.out_pm)
+            previous_hours = daily_log.total_hours or 0
             daily_log.total_hours = round((t2 - t1).seconds / 3600, 2)
+            apply_hours_delta(current_user.id, today, logged_hours=daily_log.total_hours - previous_hours)
 
     db.session.commit()
+    queue_attendance_ingest(attendance_record.id)
 
     return jsonify(
         success=True,
         id=attendance_record.id,
-        file_url=url_for('download_file', filename=filename),
+        # By record id: the re-encode job renames the file shortly after this answer
+        file_url=url_for('attendance_image', record_id=attendance_record.id),
         timestamp=attendance_record.timestamp.isoformat(),
         message="Attendance captured and saved!"
     )
 
 
+# ==========================
+# ATTENDANCE IMAGE PIPELINE (re-encode captures)
+# ==========================
+app.config.setdefault("ATTENDANCE_IMAGE_FORMAT", os.environ.get("ATTENDANCE_IMAGE_FORMAT", "WEBP"))
+app.config.setdefault("ATTENDANCE_IMAGE_QUALITY", int(os.environ.get("ATTENDANCE_IMAGE_QUALITY", 70)))
+IMAGE_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+
+def reencode_image(src, fmt, quality):
+    """
+    Write the image read from src as fmt to a spool file and return its path.
+    Only pixels are copied, so EXIF and other metadata are dropped.
+    """
+    tmp_path = spool_path()
+    with Image.open(seekable(src)) as img:
+        pixels = img.convert("RGB")
+    options = {"quality": quality, "method": 6} if fmt == "WEBP" else {"quality": quality, "optimize": True}
+    pixels.save(tmp_path, fmt, **options)
+    return tmp_path
+
+
+def reencode_attendance_image(record_id):
+    """Re-encode one capture and point its Attendance row at the new file. Returns the new name."""
+    fmt = app.config["ATTENDANCE_IMAGE_FORMAT"].upper()
+    record = db.session.get(Attendance, record_id)
+    if not record or not record.file_name or record.file_name.endswith(IMAGE_EXTENSIONS[fmt]):
+        return None
+
+    src_name = record.file_name
+    if not upload_storage.exists(src_name):
+        return None
+
+    with closing(upload_storage.open(src_name)) as src:
+        tmp_path = reencode_image(src, fmt, app.config["ATTENDANCE_IMAGE_QUALITY"])
+    dst_name = os.path.splitext(src_name)[0] + IMAGE_EXTENSIONS[fmt]
+    upload_storage.put_file(tmp_path, dst_name)
+    record.file_name = dst_name
+    db.session.commit()
+    invalidate_fragments("attendance")
+    upload_storage.delete(src_name)
+    return record.file_name
+
+
+def reencoded_upload_name(name):
+    """What a capture was re-encoded to, once the original name is gone; None otherwise."""
+    if not name.startswith("attendance_") or upload_storage.exists(name):
+        return None
+    stem = os.path.splitext(name)[0]
+    for extension in IMAGE_EXTENSIONS.values():
+        if stem + extension != name and upload_storage.exists(stem + extension):
+            return stem + extension
+    return None
+
+
+@app.route("/attendance/<int:record_id>/image")
+@login_required
+def attendance_image(record_id):
+    """A capture by record id, whatever its file is called now."""
+    record = Attendance.query.options(joinedload(Attendance.student)).get_or_404(record_id)
+    if not record.file_name or record.student is None or not can_view_student_files(record.student):
+        abort(404)
+    return send_upload(record.file_name, as_attachment=False)
+
+
+@job_handler("reencode_attendance_image")
+def reencode_attendance_image_job(record_id):
+    reencode_attendance_image(record_id)
+
+
+def queue_attendance_ingest(record_id):
+    """Re-encode a new capture on the job queue instead of the request thread."""
+    enqueue_job("reencode_attendance_image", record_id=record_id)
+
+
+@app.cli.command("reencode-attendance")
+@click.option("--batch-size", default=200, show_default=True, help="Records loaded per query.")
+def reencode_attendance_command(batch_size):
+    """Re-encode every stored attendance capture to ATTENDANCE_IMAGE_FORMAT."""
+    ext = IMAGE_EXTENSIONS[app.config["ATTENDANCE_IMAGE_FORMAT"].upper()]
+    converted = failed = saved_bytes = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Attendance.id, Attendance.file_name).filter(
+            Attendance.id > last_id, Attendance.file_name.isnot(None), ~Attendance.file_name.endswith(ext)
+        ).order_by(Attendance.id).limit(batch_size).all()
+        if not batch:
+            break
+        for record_id, file_name in batch:
+            last_id = record_id
+            before = upload_storage.size(file_name) if upload_storage.exists(file_name) else 0
+            try:
+                new_name = reencode_attendance_image(record_id)
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                click.echo(f"record {record_id}: {e}")
+                continue
+            if new_name:
+                converted += 1
+                saved_bytes += before - upload_storage.size(new_name)
+    click.echo(f"Re-encoded {converted} capture(s), {failed} failed, saved {saved_bytes / 1024:.0f} KB.")
+
+
 @app.route('/student/attendance/save', methods=['POST'])
 @login_required
 def save_attendance():
@@ -1964,6 +4301,7 @@ def delete_attendance(record_id):
     record.is_deleted = True
 
     db.session.commit()
+    invalidate_fragments("attendance")
     return jsonify({"success": True, "deleted_id": record_id, "message": "Attendance soft deleted"})
 
 @app.route('/student/restore_attendance/<int:id>', methods=['POST'])
@@ -1974,6 +4312,7 @@ def restore_attendance_student(id):
         return jsonify(success=False, error="Unauthorized")
     record.is_deleted = False
     db.session.commit()
+    invalidate_fragments("attendance")
     return jsonify(success=True)
 @app.route('/student/permanent_delete_attendance/<int:id>', methods=['POST'])
 @login_required
@@ -1981,12 +4320,18 @@ def permanent_delete_attendance(id):
     record = Attendance.query.get_or_404(id)
     if record.student_id != current_user.id:
         return jsonify(success=False, error="Unauthorized")
-    # Optionally remove the file
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], record.file_name)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    file_name = record.file_name
+    if record.hte_approved:
+        apply_hours_delta(
+            record.student_id, record.timestamp,
+            approved_hours=-attendance_hours(record), approved_records=-1
+        )
     db.session.delete(record)
     db.session.commit()
+    invalidate_fragments("attendance")
+    # Remove the capture in the background
+    if file_name:
+        enqueue_job("delete_uploads", filenames=[file_name])
     return jsonify(success=True)
 
 @app.route('/admin_daily_log/<int:student_id>')
@@ -2142,10 +4487,12 @@ def add_daily_log():
         )
 
         db.session.add(log)
+        apply_hours_delta(current_user.id, date_obj, logged_hours=total_hours)
         db.session.commit()
         flash("✅ Daily log added successfully!", "success")
 
     except Exception as e:
+        db.session.rollback()
         flash(f"❌ Failed to add daily log: {str(e)}", "danger")
 
     return redirect(url_for("student_daily_log"))
@@ -2164,6 +4511,8 @@ def delete_daily_log(log_id):
     if log.student_id != current_user.id:
         return redirect(url_for("student_daily_log"))
 
+    if log.date:
+        apply_hours_delta(log.student_id, log.date, logged_hours=-(log.total_hours or 0))
     db.session.delete(log)
     db.session.commit()
     flash("Daily log deleted successfully!", "success")
@@ -2178,6 +4527,9 @@ import os, json
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
+app.config.setdefault("DAR_MAX_BYTES", 20 * 1024 * 1024)
+
+
 @app.route("/student/dar_upload", methods=["POST"], endpoint="student_dar_upload")
 @login_required
 def student_dar_upload():
@@ -2193,39 +4545,231 @@ def student_dar_upload():
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
 
-        upload_folder = os.path.join(app.root_path, "static", "dar_uploads")
-        os.makedirs(upload_folder, exist_ok=True)
-
         saved_files = []
         for file in files:
             if file and file.filename:
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(upload_folder, filename))
-                saved_files.append(filename)
+                key = dar_file_key(file.filename)
+                dar_storage.save(key, file.stream, app.config["DAR_MAX_BYTES"])
+                saved_files.append(key)
 
         if not saved_files:
             return jsonify({"success": False, "error": "No valid files uploaded."}), 400
 
-        # Save record in DB
-        new_dar = DailyAccomplishment(
-            student_id=current_user.id,
-            date=date_obj,
-            accomplishment=json.dumps(saved_files)  # JSON list of filenames
+        return create_dar_record(date_obj, saved_files)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def dar_file_key(filename, token=None, student_id=None):
+    """Unique storage key for a DAR file, so two students' `report.pdf` never collide."""
+    student_id = student_id or current_user.id
+    return f"dar_{student_id}_{(token or uuid.uuid4().hex)[:12]}_{secure_filename(filename) or 'file'}"
+
+
+DAR_KEY_RE = re.compile(r"dar_(\d+)_[0-9a-f]{12}_(.+)")
+
+
+@app.template_filter("upload_name")
+def upload_name_filter(key):
+    """Original filename of a uniquely keyed DAR file (older plain names pass through)."""
+    match = DAR_KEY_RE.fullmatch(key or "")
+    return match.group(2) if match else key
+
+
+def create_dar_record(date_obj, keys):
+    """Save the DailyAccomplishment for stored files and answer the upload."""
+    new_dar = DailyAccomplishment(
+        student_id=current_user.id,
+        date=date_obj,
+        accomplishment=json.dumps(keys)  # JSON list of storage keys
+    )
+    db.session.add(new_dar)
+    db.session.commit()
+
+    return jsonify({
+        "success": True,
+        "id": new_dar.id,
+        "date": new_dar.date.isoformat(),
+        "files": keys,
+        "names": [upload_name_filter(key) for key in keys],
+        "file_base_url": url_for("download_accomplishment", filename="_", _external=True).rsplit("/", 1)[0]
+    })
+
+
+# ==========================
+# DAR CHUNKED UPLOADS (init -> numbered chunks -> finalize)
+# ==========================
+# Chunks are appended to a spool file; the offset lives in upload_session, so a
+# client that lost its connection asks for the offset and carries on from there.
+# With several app hosts, SPOOL_FOLDER must be shared (or uploads kept sticky).
+app.config.setdefault("DAR_CHUNK_SIZE", 1024 * 1024)
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+
+def upload_spool_path(upload_id):
+    return os.path.join(SPOOL_FOLDER, f"dar-{upload_id}.part")
+
+
+def lock_spool_file(f):
+    """Take an exclusive lock on an open spool file without waiting; False if another request holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True  # released when the file is closed
+
+
+def own_upload_session(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if not upload or upload.student_id != current_user.id:
+        abort(404)
+    return upload
+
+
+def upload_session_state(upload):
+    return {
+        "success": True,
+        "upload_id": upload.id,
+        "offset": upload.received,
+        "size": upload.size,
+        "complete": upload.received >= upload.size,
+        "chunk_size": app.config["DAR_CHUNK_SIZE"],
+    }
+
+
+@app.route("/student/dar_upload/init", methods=["POST"])
+@login_required
+def student_dar_upload_init():
+    if current_user.role != "student":
+        return jsonify({"success": False, "error": "Unauthorized access"}), 403
+
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get("filename") or "")
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size <= 0:
+        return jsonify({"success": False, "error": "filename and size are required."}), 400
+    if size > app.config["DAR_MAX_BYTES"]:
+        return jsonify({"success": False, "error": "File is too large."}), 413
+
+    upload = UploadSession(id=uuid.uuid4().hex, student_id=current_user.id, filename=filename, size=size)
+    db.session.add(upload)
+    db.session.commit()
+    open(upload_spool_path(upload.id), "wb").close()
+    return jsonify(upload_session_state(upload)), 201
+
+
+@app.route("/student/dar_upload/<upload_id>", methods=["GET"])
+@login_required
+def student_dar_upload_status(upload_id):
+    """Where to resume: the server-side offset of an upload."""
+    return jsonify(upload_session_state(own_upload_session(upload_id)))
+
+
+@app.route("/student/dar_upload/<upload_id>/<int:offset>", methods=["PUT"])
+@login_required
+def student_dar_upload_chunk(upload_id, offset):
+    """Write one chunk (raw request body) at offset; anything but the current offset is a 409."""
+    upload = own_upload_session(upload_id)
+    if offset != upload.received:
+        return jsonify({**upload_session_state(upload), "success": False, "error": "Offset mismatch."}), 409
+
+    limit = min(upload.size - offset, 2 * app.config["DAR_CHUNK_SIZE"])
+    path = upload_spool_path(upload.id)
+    if not os.path.exists(path):
+        abort(404)
+    written = 0
+    with open(path, "r+b") as out:
+        # One writer per spool file: a concurrent chunk at the same offset would interleave its bytes
+        if not lock_spool_file(out):
+            return jsonify({**upload_session_state(upload), "success": False, "error": "Chunk already in progress."}), 409
+        db.session.rollback()  # new transaction: the offset is re-read as the last lock holder left it
+        if offset != upload.received:
+            return jsonify({**upload_session_state(upload), "success": False, "error": "Offset mismatch."}), 409
+
+        # Drop bytes past the recorded offset left by a chunk that died half-written
+        out.seek(offset)
+        out.truncate()
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > limit:
+                out.truncate(offset)
+                return jsonify({"success": False, "error": "Chunk is too large."}), 413
+            out.write(chunk)
+
+        # Advanced before the lock is released, so the next writer sees the new offset
+        advanced = UploadSession.query.filter_by(id=upload.id, received=offset).update(
+            {"received": offset + written, "updated_at": datetime.now()}, synchronize_session=False
         )
-        db.session.add(new_dar)
         db.session.commit()
+    if not advanced:
+        db.session.refresh(upload)
+        return jsonify({**upload_session_state(upload), "success": False, "error": "Offset mismatch."}), 409
+    record_upload_bytes(written)
+    db.session.refresh(upload)
+    return jsonify(upload_session_state(upload))
 
-        return jsonify({
-            "success": True,
-            "id": new_dar.id,
-            "date": new_dar.date.isoformat(),
-            "files": saved_files,
-            "file_base_url": url_for("static", filename="dar_uploads", _external=True)
-        })
 
-    except Exception as e:
+@app.route("/student/dar_upload/finalize", methods=["POST"])
+@login_required
+def student_dar_upload_finalize():
+    """Move completed uploads into storage and create the DailyAccomplishment row."""
+    if current_user.role != "student":
+        return jsonify({"success": False, "error": "Unauthorized access"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        date_obj = datetime.strptime(data.get("dar_date") or "", "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"success": False, "error": "Date is required."}), 400
+    upload_ids = data.get("upload_ids") or []
+    if not isinstance(upload_ids, list) or not all(isinstance(upload_id, str) for upload_id in upload_ids):
+        return jsonify({"success": False, "error": "upload_ids must be a list of upload ids."}), 400
+    upload_ids = list(dict.fromkeys(upload_ids))  # an id listed twice is still one file
+    if not upload_ids:
+        return jsonify({"success": False, "error": "No valid files uploaded."}), 400
+
+    uploads = [own_upload_session(upload_id) for upload_id in upload_ids]
+    incomplete = [upload.id for upload in uploads if upload.received != upload.size]
+    if incomplete:
+        return jsonify({"success": False, "error": "Upload incomplete.", "incomplete": incomplete}), 409
+
+    # Claim the sessions: a concurrent finalize of the same uploads waits on these rows, then finds them gone
+    claimed = UploadSession.query.filter(
+        UploadSession.id.in_(upload_ids), UploadSession.student_id == current_user.id
+    ).delete(synchronize_session=False)
+    missing = [upload.id for upload in uploads if not os.path.exists(upload_spool_path(upload.id))]
+    if claimed != len(upload_ids) or missing:
         db.session.rollback()
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": "Upload already finalized or missing.", "missing": missing}), 409
+
+    keys = []
+    for upload in uploads:
+        key = dar_file_key(upload.filename, upload.id)
+        dar_storage.put_file(upload_spool_path(upload.id), key)
+        keys.append(key)
+    return create_dar_record(date_obj, keys)
+
+
+@job_handler("expire_upload_sessions")
+def expire_upload_sessions_job():
+    """Drop chunked uploads abandoned for longer than UPLOAD_SESSION_TTL, with their spool files."""
+    cutoff = datetime.now() - UPLOAD_SESSION_TTL
+    for upload in UploadSession.query.filter(UploadSession.updated_at < cutoff).all():
+        path = upload_spool_path(upload.id)
+        if os.path.exists(path):
+            os.remove(path)
+        db.session.delete(upload)
+    db.session.commit()
+
 
 @app.route('/view_accomplishment_reports/<int:student_id>')
 @login_required
@@ -2246,17 +4790,206 @@ def view_accomplishment_reports(student_id):
 @app.route('/download_accomplishment/<filename>')
 @login_required
 def download_accomplishment(filename):
-    upload_folder = app.config['UPLOAD_FOLDER']
-    return send_from_directory(upload_folder, filename, as_attachment=True)
+    if not can_download_dar(filename):
+        abort(404)
+    # DAR files open in the browser tab the dashboards link them into
+    return send_stored(dar_storage, filename, download_name=upload_name_filter(filename), as_attachment=False)
 
 
 # ==========================
 # DOWNLOAD FILE ROUTE (FORCE DIRECT DOWNLOAD)
 # ==========================
+def send_upload(name, as_attachment=True):
+    """Send an upload by its stored name: a blob key or a plain upload name."""
+    if is_blob_key(name):
+        blob = db.session.get(Blob, name)
+        if not blob:
+            abort(404)
+        # The blob key is the SHA-256 of the content: a strong ETag that never goes stale
+        return send_stored(
+            blob_storage, name, download_name=blob.filename or name, as_attachment=as_attachment,
+            etag=name.split(".", 1)[0], immutable=True,
+        )
+    return send_stored(upload_storage, name, as_attachment=as_attachment)
+
+
+def can_view_student_files(student):
+    """Admins see every student's files; others only their own, their child's or their assigned students'."""
+    return current_user.role == "admin" or current_user.id in (student.id, student.parent_id, student.hte_id)
+
+
+def can_view_endorsement(endorsement):
+    """The student, the endorsement's HTE, the student's assigned HTE and admins."""
+    if current_user.role == "admin" or current_user.id in (endorsement.student_id, endorsement.hte_id):
+        return True
+    return endorsement.student is not None and endorsement.student.hte_id == current_user.id
+
+
+def can_download_upload(name):
+    """Whether the current user may fetch an upload or blob key: a row they can see must reference it."""
+    if current_user.role == "admin":
+        return True
+    students = User.query.join(Attendance, Attendance.student_id == User.id).filter(Attendance.file_name == name)
+    if any(can_view_student_files(student) for student in students):
+        return True
+    endorsements = Endorsement.query.filter(
+        (Endorsement.endorsement_file == name) | (Endorsement.hte_endorsement_file == name)
+    )
+    return any(can_view_endorsement(endorsement) for endorsement in endorsements)
+
+
+def can_download_dar(name):
+    """DAR keys carry their student's id; older plain names are looked up in the DAR rows listing them."""
+    if current_user.role == "admin":
+        return True
+    match = DAR_KEY_RE.fullmatch(name)
+    if match:
+        student_ids = [int(match.group(1))]
+    else:
+        student_ids = [student_id for (student_id,) in db.session.query(DailyAccomplishment.student_id).filter(
+            DailyAccomplishment.accomplishment.contains(name)
+        )]
+    students = User.query.filter(User.id.in_(student_ids)).all() if student_ids else []
+    return any(can_view_student_files(student) for student in students)
+
+
 @app.route("/uploads/<filename>")
 @login_required
 def download_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
+    # Checked before send_upload hands the file to the web server (X-Accel-Redirect / X-Sendfile)
+    if not can_download_upload(filename):
+        # Pages rendered before a capture was re-encoded still link its original name
+        successor = reencoded_upload_name(filename)
+        if successor:
+            return redirect(url_for("download_file", filename=successor))
+        abort(404)
+    return send_upload(filename, as_attachment=True)
+
+
+# ==========================
+# ATTENDANCE THUMBNAILS (generated once, cached on disk)
+# ==========================
+app.config.setdefault("THUMBNAIL_SIZE", 200)  # px square; tiles render at 100px, 2x for HiDPI
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, "thumbs")
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+
+
+def thumbnail_path(filename):
+    """
+    Path of the local thumbnail cache entry for an upload, generating it if missing.
+    Uploads are never rewritten in place (re-encoding changes the name), so a cached
+    thumbnail stays valid for as long as its upload exists.
+    """
+    size = app.config["THUMBNAIL_SIZE"]
+    thumb_path = safe_join(THUMBNAIL_FOLDER, f"{filename}.{size}.webp")
+    if not thumb_path:
+        abort(404)
+    if os.path.exists(thumb_path):
+        return thumb_path
+    if not upload_storage.exists(filename):
+        abort(404)
+
+    try:
+        with closing(upload_storage.open(filename)) as src, Image.open(seekable(src)) as img:
+            thumb = ImageOps.fit(img.convert("RGB"), (size, size))
+    except OSError:
+        abort(404)  # not an image
+    # A scratch name of our own: workers rendering the same thumbnail at once each
+    # write a whole file and the last rename wins, never a half-written one
+    tmp_path = spool_path()
+    try:
+        thumb.save(tmp_path, "WEBP", quality=75)
+        os.replace(tmp_path, thumb_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return thumb_path
+
+
+@app.route("/uploads/thumbs/<filename>")
+@login_required
+def download_thumbnail(filename):
+    if not can_download_upload(filename):
+        successor = reencoded_upload_name(filename)
+        if successor:
+            return redirect(url_for("download_thumbnail", filename=successor))
+        abort(404)
+    # Inline, cacheable for a year; the ETag lets revalidation end in a 304
+    response = send_file(
+        thumbnail_path(filename), mimetype="image/webp", conditional=True, etag=True, max_age=THUMBNAIL_MAX_AGE
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+# ==========================
+# UPLOAD CLEANUP (background jobs)
+# ==========================
+ORPHAN_GRACE_SECONDS = 24 * 3600  # never touch files younger than this; their row may not be committed yet
+UPLOAD_PREFIXES = ("attendance_", "admin_", "to_hte_", "to_admin_", "hte_")
+
+
+def referenced_uploads(names=None):
+    """Upload names still pointed at by Attendance or Endorsement rows (limited to names if given)."""
+    attendance = db.session.query(Attendance.file_name).filter(Attendance.file_name.isnot(None))
+    endorsements = db.session.query(Endorsement.endorsement_file, Endorsement.hte_endorsement_file)
+    if names is not None:
+        attendance = attendance.filter(Attendance.file_name.in_(names))
+        endorsements = endorsements.filter(db.or_(
+            Endorsement.endorsement_file.in_(names), Endorsement.hte_endorsement_file.in_(names)
+        ))
+    referenced = {name for (name,) in attendance}
+    for pair in endorsements:
+        referenced.update(name for name in pair if name)
+    return referenced
+
+
+def remove_upload(filename):
+    """Delete an upload and its cached thumbnails. Returns the bytes freed."""
+    freed = 0
+    if upload_storage.exists(filename):
+        freed += upload_storage.size(filename)
+        upload_storage.delete(filename)
+    for entry in os.scandir(THUMBNAIL_FOLDER):
+        if entry.name.startswith(filename + ".") and entry.is_file():
+            freed += entry.stat().st_size
+            os.remove(entry.path)
+    return freed
+
+
+@job_handler("delete_uploads")
+def delete_uploads_job(filenames):
+    """Remove files whose rows were deleted, unless another row still uses the same name."""
+    keep = referenced_uploads(filenames)
+    for filename in filenames:
+        if filename not in keep:
+            remove_upload(filename)
+
+
+@job_handler("cleanup_orphan_files")
+def cleanup_orphan_files_job():
+    """Sweep upload storage for app-generated files no row references any more."""
+    referenced = referenced_uploads()
+    cutoff = time_module.time() - ORPHAN_GRACE_SECONDS
+    removed = freed = 0
+    stored = set()
+    for name, mtime, size in list(upload_storage.iter_files()):
+        if name.startswith(UPLOAD_PREFIXES) and name not in referenced and mtime < cutoff:
+            freed += remove_upload(name)
+            removed += 1
+        else:
+            stored.add(name)
+    # Thumbnails whose source upload is gone
+    for entry in os.scandir(THUMBNAIL_FOLDER):
+        source = entry.name.rsplit(".", 2)[0]
+        if entry.is_file() and source not in stored:
+            freed += entry.stat().st_size
+            os.remove(entry.path)
+    print(f"🧹 Removed {removed} orphaned upload(s), freed {freed / 1024:.0f} KB")
+    collect_blobs_job()
+    expire_upload_sessions_job()
+
 
 # ==========================
 # STUDENT DOWNLOAD ENDORSEMENT
@@ -2271,11 +5004,7 @@ def download_endorsement(req_id):
     if not endorsement.endorsement_file:
         flash("No endorsement file available for download.", "danger")
         return redirect(url_for("student_dashboard"))
-    return send_from_directory(
-        UPLOAD_FOLDER,
-        endorsement.endorsement_file,
-        as_attachment=True
-    )
+    return send_upload(endorsement.endorsement_file, as_attachment=True)
 
 # ==========================
 # HTE DOWNLOAD APPROVED ENDORSEMENT (NEW)
@@ -2287,14 +5016,109 @@ def hte_download_approved(req_id):
         flash("Unauthorized access!", "danger")
         return redirect(url_for("index"))
     endorsement = Endorsement.query.get_or_404(req_id)
+    if not can_view_endorsement(endorsement):
+        flash("Unauthorized access!", "danger")
+        return redirect(url_for("hte_dashboard"))
     if not endorsement.hte_endorsement_file:
         flash("No approved endorsement file available.", "danger")
         return redirect(url_for("hte_dashboard"))
-    return send_from_directory(
-        UPLOAD_FOLDER,
-        endorsement.hte_endorsement_file,
-        as_attachment=True
-    )
+    return send_upload(endorsement.hte_endorsement_file, as_attachment=True)
+
+# ==========================
+# SCHEMA MIGRATION & QUERY PLANS
+# ==========================
+def migrate_schema():
+    """
+    Create missing tables, then any declared index an existing table lacks. Safe to re-run.
+    Returns (created, skipped) index names; indexes on columns the live table lacks are skipped.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    created, skipped = [], []
+    for table in db.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        columns = {col["name"] for col in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if not {col.name for col in index.columns} <= columns:
+                skipped.append(index.name)
+                continue
+            index.create(db.engine)
+            created.append(index.name)
+    return created, skipped
+
+
+def hot_queries():
+    """Representative statements for the dashboard and chat routes, keyed by a short label."""
+    return {
+        "attendance approved by student": db.select(Attendance).filter_by(student_id=1, hte_approved=True)
+            .order_by(Attendance.timestamp.desc()),
+        "attendance active by student": db.select(Attendance).filter_by(student_id=1, is_deleted=False)
+            .order_by(Attendance.timestamp.desc()),
+        "unread by receiver and role": db.select(db.func.count(ChatMessage.id))
+            .filter_by(receiver_id=1, read=False, sender_role="admin"),
+        "conversation page": db.select(ChatMessage).filter(conversation_filter(1, 2))
+            .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(CHAT_PAGE_SIZE + 1),
+        "daily logs by student": db.select(DailyLog).filter_by(student_id=1).order_by(DailyLog.date.desc()),
+        "daily log by attendance": db.select(DailyLog).filter_by(attendance_id=1),
+        "users by role": db.select(User).filter_by(role="student"),
+        "students of hte": db.select(User).filter_by(hte_id=1, role="student"),
+        "dar by student": db.select(DailyAccomplishment).filter_by(student_id=1)
+            .order_by(DailyAccomplishment.date.desc()),
+        "attendance by file name": db.select(Attendance.student_id).filter_by(file_name="x.png"),
+        "endorsement by file": db.select(Endorsement).filter(
+            (Endorsement.endorsement_file == "x.pdf") | (Endorsement.hte_endorsement_file == "x.pdf")
+        ),
+    }
+
+
+def explain_uses_index(stmt):
+    """Return (uses_index, plan_lines) for a statement on the current database."""
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    dialect = db.engine.dialect.name
+
+    if dialect == "sqlite":
+        rows = db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql)).all()
+        lines = [row[-1] for row in rows]
+        # "SCAN t" reads the whole table; "SCAN t USING INDEX ..." walks an index in order
+        full_scans = [line for line in lines if line.startswith("SCAN ") and "INDEX" not in line]
+        uses_index = any("INDEX" in line for line in lines) and not full_scans
+        return uses_index, lines
+
+    if dialect == "mysql":
+        rows = db.session.execute(db.text("EXPLAIN " + sql)).mappings().all()
+        lines = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+        uses_index = all(row["key"] and row["type"] != "ALL" for row in rows)
+        return uses_index, lines
+
+    raise click.ClickException(f"Query plan check does not support {dialect}.")
+
+
+@app.cli.command("migrate-schema")
+def migrate_schema_command():
+    """Create missing tables and indexes on the configured database."""
+    created, skipped = migrate_schema()
+    for name in created:
+        click.echo(f"created index {name}")
+    for name in skipped:
+        click.echo(f"skipped index {name}: table is missing one of its columns")
+    click.echo(f"Schema migrated ({len(created)} index(es) created, {len(skipped)} skipped).")
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail unless every hot dashboard/chat query is answered through an index."""
+    failures = 0
+    for label, stmt in hot_queries().items():
+        uses_index, lines = explain_uses_index(stmt)
+        click.echo(f"[{'ok' if uses_index else 'FAIL'}] {label}")
+        for line in lines:
+            click.echo(f"    {line}")
+        failures += not uses_index
+    if failures:
+        raise click.ClickException(f"{failures} query(ies) not using an index.")
+
 
 # -------------------------------
 # SocketIO events
@@ -2318,5 +5142,92 @@ def handle_call_end():
     # Here you can notify student to close video
 
 
+# -------------------------------
+# Chat push (one Socket.IO room per conversation)
+# -------------------------------
+def chat_room(user_id, partner_id):
+    """Room shared by both sides of a conversation, whichever side joins."""
+    low, high = sorted((int(user_id), int(partner_id)))
+    return f"chat_{low}_{high}"
+
+
+def push_chat_message(msg, sender_name=None):
+    """Emit a newly committed ChatMessage to everyone viewing that conversation."""
+    socketio.emit("chat_message", {
+        "id": msg.id,
+        "sender_id": msg.sender_id,
+        "receiver_id": msg.receiver_id,
+        "sender_role": msg.sender_role,
+        "receiver_role": msg.receiver_role,
+        "sender_name": sender_name or (msg.sender.name if msg.sender else "Unknown"),
+        "content": msg.content,
+        "timestamp": msg.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+    }, to=chat_room(msg.sender_id, msg.receiver_id))
+    CHAT_MESSAGES.labels(f"{msg.sender_role}_to_{msg.receiver_role}").inc()
+
+
+# -------------------------------
+# Notifications (one Socket.IO room per user, fanned out by the job queue)
+# -------------------------------
+def user_room(user_id):
+    return f"user_{int(user_id)}"
+
+
+@job_handler("notify")
+def notify_job(user_ids, event, data):
+    for user_id in user_ids:
+        socketio.emit(event, data, to=user_room(user_id))
+
+
+def notify_users(user_ids, event, **data):
+    user_ids = [int(user_id) for user_id in user_ids if user_id]
+    if user_ids:
+        enqueue_job("notify", user_ids=user_ids, event=event, data=data)
+
+
+def admin_ids():
+    return [user_id for (user_id,) in db.session.query(User.id).filter(User.role == "admin")]
+
+
+def notify_endorsement(endorsement, user_ids):
+    notify_users(user_ids, "endorsement_update", id=endorsement.id, title=endorsement.title, status=endorsement.status)
+
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    SOCKET_CONNECTIONS.inc()
+    if current_user.is_authenticated:
+        join_room(user_room(current_user.id))
+
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    SOCKET_CONNECTIONS.dec()
+
+
+@socketio.on('join_chat')
+def handle_join_chat(data):
+    # Only logged-in users, and only rooms they are a member of
+    if not current_user.is_authenticated:
+        return False
+    try:
+        partner_id = int((data or {}).get('partnerId'))
+    except (TypeError, ValueError):
+        return False
+    join_room(chat_room(current_user.id, partner_id))
+    return True
+
+
+@socketio.on('leave_chat')
+def handle_leave_chat(data):
+    if not current_user.is_authenticated:
+        return
+    try:
+        partner_id = int((data or {}).get('partnerId'))
+    except (TypeError, ValueError):
+        return
+    leave_room(chat_room(current_user.id, partner_id))
+
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,196 @@
+"""
+Synthetic OJT cohort for load tests: students, HTEs, parents, months of
+attendance captures, daily logs, chat threads, endorsements and DAR files.
+
+Writes to the configured DATABASE_URL and storage, so point both somewhere
+disposable first:
+
+    DATABASE_URL=sqlite:////tmp/ims.db STORAGE_ROOT=/tmp/ims python -m bench.cohort --reset --students 200
+
+The same --seed and --end always produce the same rows. Every generated user
+logs in with the password "<role>123" (admin123, hte123, parent123, student123).
+"""
+import argparse
+import io
+import random
+from datetime import date, datetime, time, timedelta
+
+from PIL import Image
+from sqlalchemy import insert
+
+from app import (
+    app, db, User, Attendance, DailyLog, ChatMessage, Endorsement, DailyAccomplishment,
+    dar_file_key, dar_storage, hash_password, migrate_schema, rebuild_hours_ledger, rebuild_unread_counters,
+    store_blob, upload_storage,
+)
+
+CAPTURE_TIMES = (time(8, 0), time(12, 0), time(13, 0), time(17, 0))  # in/out AM, in/out PM
+ENDORSEMENT_STATUSES = ("Requested", "For HTE", "For Student", "Approved")
+CHAT_LINES = (
+    "Good morning po!", "Noted, thank you.", "Please submit your DAR for this week.",
+    "I will be late today because of the rain.", "Your attendance for Monday is approved.",
+    "Can I ask about the endorsement letter?", "See you tomorrow.", "Okay po.",
+)
+
+
+def weekdays(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def seed_capture_files(count=4):
+    """A few small PNGs every generated capture points at (attendance files are not benchmarked)."""
+    names = []
+    for i in range(count):
+        buf = io.BytesIO()
+        Image.new("RGB", (320, 240), (40 * i, 120, 200)).save(buf, "PNG")
+        name = f"attendance_seed_{i}.png"
+        upload_storage.save(name, io.BytesIO(buf.getvalue()), len(buf.getvalue()))
+        names.append(name)
+    return names
+
+
+def generate(students=40, htes=4, parents=20, months=3, messages=20, end=date(2025, 10, 31), seed=1):
+    """Insert a cohort and rebuild the derived tables. Returns row counts per table."""
+    rng = random.Random(seed)
+    start = end - timedelta(days=30 * months)
+
+    # One hash per role: bcrypt at the configured cost is too slow to run per generated user
+    passwords = {role: hash_password(f"{role}123") for role in ("admin", "hte", "parent", "student")}
+    admin = User(name="Admin", username="admin", password=passwords["admin"], role="admin")
+    hte_users = [
+        User(name=f"HTE {i + 1}", username=f"hte{i + 1}", password=passwords["hte"], role="hte") for i in range(htes)
+    ]
+    parent_users = [
+        User(name=f"Parent {i + 1}", username=f"parent{i + 1}", password=passwords["parent"], role="parent")
+        for i in range(parents)
+    ]
+    db.session.add_all([admin, *hte_users, *parent_users])
+    db.session.flush()
+    student_users = [
+        User(
+            name=f"Student {i + 1}", username=f"stud{i + 1}", password=passwords["student"], role="student",
+            hte_id=hte_users[i % htes].id if htes else None,
+            parent_id=parent_users[i % parents].id if parents and rng.random() < 0.8 else None,
+        )
+        for i in range(students)
+    ]
+    db.session.add_all(student_users)
+    db.session.flush()
+
+    captures = seed_capture_files()
+    attendance_rows, log_rows, message_rows = [], [], []
+    days = list(weekdays(start, end))
+    for student in student_users:
+        for day in days:
+            if rng.random() < 0.1:  # absent
+                continue
+            approved = day < end - timedelta(days=3) and rng.random() < 0.9
+            for slot in CAPTURE_TIMES:
+                stamp = datetime.combine(day, slot) + timedelta(minutes=rng.randint(-10, 10))
+                attendance_rows.append({
+                    "student_id": student.id, "file_name": rng.choice(captures), "date": day,
+                    "timestamp": stamp, "total_hours": 2.0, "present": approved, "hte_approved": approved,
+                    "is_deleted": False,
+                })
+            log_rows.append({
+                "student_id": student.id, "date": day, "time": time(17, 0), "total_hours": 8.0,
+                "description": "Assisted with daily office tasks.", "visible_to_admin": approved,
+            })
+
+        threads = [(student, admin)]
+        if student.hte_id:
+            threads.append((student, db.session.get(User, student.hte_id)))
+        for a, b in threads:
+            message_rows += chat_thread(rng, a, b, messages, start, end)
+
+    for hte in hte_users:
+        message_rows += chat_thread(rng, hte, admin, messages, start, end)
+
+    for table, rows in ((Attendance, attendance_rows), (DailyLog, log_rows), (ChatMessage, message_rows)):
+        for i in range(0, len(rows), 5000):
+            db.session.execute(insert(table), rows[i:i + 5000])
+
+    endorsements = dars = 0
+    for student in student_users:
+        status = rng.choice(ENDORSEMENT_STATUSES)
+        endorsement = Endorsement(
+            student_id=student.id, hte_id=student.hte_id, title="Endorsement Letter",
+            description=f"Endorsement request of {student.name}", status=status,
+        )
+        if status != "Requested":
+            endorsement.endorsement_file = store_blob(
+                io.BytesIO(f"%PDF-1.4 endorsement {student.id}".encode()), "endorsement.pdf"
+            )
+        if status == "Approved":
+            endorsement.hte_endorsement_file = store_blob(
+                io.BytesIO(f"%PDF-1.4 signed {student.id}".encode()), "signed.pdf"
+            )
+        db.session.add(endorsement)
+        endorsements += 1
+
+        for week_start in days[::5]:
+            key = dar_file_key(f"dar_{week_start.isoformat()}.pdf", f"{rng.getrandbits(48):012x}", student.id)
+            dar_storage.save(key, io.BytesIO(f"%PDF-1.4 DAR {student.id} {week_start}".encode()), 1024)
+            db.session.add(DailyAccomplishment(student_id=student.id, date=week_start, accomplishment=f'["{key}"]'))
+            dars += 1
+
+    rebuild_hours_ledger()
+    rebuild_unread_counters()
+    db.session.commit()
+    return {
+        "users": 1 + htes + parents + students,
+        "attendance": len(attendance_rows),
+        "daily_logs": len(log_rows),
+        "chat_messages": len(message_rows),
+        "endorsements": endorsements,
+        "dar_files": dars,
+    }
+
+
+def chat_thread(rng, a, b, count, start, end):
+    """`count` alternating messages between a and b, spread over the period; the last few unread."""
+    span = (end - start).total_seconds()
+    stamps = sorted(datetime.combine(start, time(8, 0)) + timedelta(seconds=rng.random() * span) for _ in range(count))
+    rows = []
+    for i, stamp in enumerate(stamps):
+        sender, receiver = (a, b) if i % 2 == 0 else (b, a)
+        rows.append({
+            "sender_id": sender.id, "receiver_id": receiver.id,
+            "sender_role": sender.role, "receiver_role": receiver.role,
+            "content": rng.choice(CHAT_LINES), "timestamp": stamp, "read": i < count - 3,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--htes", type=int, default=4)
+    parser.add_argument("--parents", type=int, default=20)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=20, help="messages per chat thread")
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2025, 10, 31), help="last day of attendance")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        migrate_schema()
+        if User.query.first() is not None:
+            parser.error("the database already has users; pass --reset to replace them")
+        counts = generate(
+            args.students, args.htes, args.parents, args.months, args.messages, args.end, args.seed
+        )
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print("✅ Cohort generated!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Login throughput at different bcrypt costs, through the Flask test client
+against a throwaway SQLite database.
+
+    python -m bench.login                                # costs 10-13, 8 clients
+    python -m bench.login --costs 11 12 --clients 32 --workers 4 --save login.json
+
+Every cost runs --logins POST /login requests from --clients concurrent clients,
+with PASSWORD_HASH_WORKERS=--workers, and reports logins/s and p50/p95 latency.
+Beyond `workers` concurrent logins, requests wait for the hash pool: latency grows
+while CPU use stays capped.
+"""
+import argparse
+import json
+import math
+import shutil
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.sandbox import WORKDIR  # before app: sets the database and storage paths
+
+from app import app, db, User, hash_password, init_password_hashing, migrate_schema
+
+PASSWORD = "student123"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def bench_cost(cost, workers, clients, logins):
+    app.config["PASSWORD_BCRYPT_ROUNDS"] = cost
+    app.config["PASSWORD_HASH_WORKERS"] = workers
+    init_password_hashing()
+
+    with app.app_context():
+        User.query.delete()
+        hashed = hash_password(PASSWORD)  # same cost as configured, so no rehash on login
+        db.session.add_all(
+            User(name=f"Student {i}", username=f"stud{i}", password=hashed, role="student") for i in range(clients)
+        )
+        db.session.commit()
+
+    def login(i):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/login", data={"username": f"stud{i % clients}", "password": PASSWORD, "role": "student"})
+        elapsed = (time.perf_counter() - started) * 1000
+        if not response.headers.get("Location", "").endswith("/student_dashboard"):
+            raise RuntimeError(f"login failed at cost {cost}: {response.status_code}")
+        return elapsed
+
+    login(0)  # warm-up
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        timings = list(pool.map(login, range(logins)))
+    wall = time.perf_counter() - started
+    return {
+        "cost": cost,
+        "logins_per_s": round(logins / wall, 2),
+        "p50_ms": round(statistics.median(timings), 1),
+        "p95_ms": round(percentile(timings, 95), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--costs", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--workers", type=int, default=2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent login requests")
+    parser.add_argument("--logins", type=int, default=40, help="logins per cost")
+    parser.add_argument("--save", help="write the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        with app.app_context():
+            migrate_schema()
+        results = []
+        for cost in args.costs:
+            result = bench_cost(cost, args.workers, args.clients, args.logins)
+            results.append(result)
+            print(f"cost {cost:2d}: {result['logins_per_s']:8.2f} logins/s  "
+                  f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms", flush=True)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"workers": args.workers, "clients": args.clients, "logins": args.logins, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved results to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark the heavy routes through the Flask test client against a generated
+cohort in a throwaway SQLite database (no network, nothing outside a temp dir).
+
+    python -m bench.run                                  # small cohort, print results
+    python -m bench.run --profile medium --save bench/baselines/medium.json
+    python -m bench.run --compare bench/baselines/small.json
+
+Each route reports p50/p95 latency, SQL statements per request and the peak
+memory Python allocated while serving it. --compare exits 1 when a route issues
+more statements than the baseline, or its p95 latency or peak memory grew past
+the tolerances (latency is loose by default, baselines come from other machines).
+"""
+import argparse
+import json
+import math
+import platform
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bench.sandbox import WORKDIR  # before app: sets the database and storage paths
+
+from sqlalchemy import event
+
+from app import app, db, User, invalidate_fragments, migrate_schema
+from bench.cohort import generate
+
+PROFILES = {
+    "small": {"students": 40, "htes": 4, "parents": 20, "months": 3, "messages": 20},
+    "medium": {"students": 200, "htes": 10, "parents": 100, "months": 6, "messages": 40},
+    "large": {"students": 1000, "htes": 40, "parents": 500, "months": 6, "messages": 60},
+}
+
+# name -> (role of the user making the request, method, path, JSON body, drop cached fragments first)
+ROUTES = {
+    "admin_dashboard": ("admin", "GET", "/admin", None, False),
+    "admin_dashboard_cold": ("admin", "GET", "/admin", None, True),
+    "view_students": ("admin", "GET", "/view_students", None, False),
+    "admin_view_dar": ("admin", "GET", "/admin/view_dar/{student}", None, False),
+    "hte_dashboard": ("hte", "GET", "/hte", None, False),
+    "student_dashboard": ("student", "GET", "/student_dashboard", None, False),
+    "parent_dashboard": ("parent", "GET", "/parent", None, False),
+    "student_chat": ("student", "GET", "/student_chat", None, False),
+    "student_chat_poll": ("student", "GET", "/get_messages/{admin}", None, False),
+    "hte_chat_poll": ("hte", "GET", "/hte/get_messages/{student}", None, False),
+    "hte_admin_chat_poll": ("hte", "GET", "/get_admin_hte_messages/{hte}", None, False),
+    "send_message": ("student", "POST", "/send_message", {"receiver_id": "{admin}", "content": "Benchmark ping"}, False),
+}
+
+
+def pick_users():
+    """One user per role; the student has a parent and an HTE so every route has data."""
+    student = User.query.filter(User.role == "student", User.parent_id.isnot(None), User.hte_id.isnot(None)).first()
+    return {
+        "admin": User.query.filter_by(role="admin").first(),
+        "hte": db.session.get(User, student.hte_id),
+        "parent": db.session.get(User, student.parent_id),
+        "student": student,
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def bench_route(client, method, path, body, cold, iterations, counter):
+    def call():
+        if cold:
+            invalidate_fragments("users", "endorsements", "attendance")
+        return client.open(path, method=method, json=body)
+
+    response = call()  # warm-up: template compilation, first-touch caches
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {path} answered {response.status_code}")
+
+    timings, queries = [], []
+    for _ in range(iterations):
+        counter["n"] = 0
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter["n"])
+
+    # Memory in a separate pass, tracemalloc would skew the timings
+    tracemalloc.start()
+    peak = 0
+    for _ in range(3):
+        tracemalloc.reset_peak()
+        call()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "queries": max(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(profile, iterations, only=None):
+    with app.app_context():
+        migrate_schema()
+        cohort = generate(**PROFILES[profile])
+        ids = {role: user.id for role, user in pick_users().items()}
+        engine = db.engine
+
+    # Requests run outside that context, so each gets its own `g` (and logged-in user)
+    counter = {"n": 0}
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter["n"] += 1
+
+    event.listen(engine, "after_cursor_execute", count)
+    results = {}
+    for name, (role, method, path, body, cold) in ROUTES.items():
+        if only and name not in only:
+            continue
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(ids[role])
+            sess["_fresh"] = True
+        if body:
+            body = {key: (int(value.format(**ids)) if isinstance(value, str) and value.startswith("{") else value)
+                    for key, value in body.items()}
+        results[name] = bench_route(client, method, path.format(**ids), body, cold, iterations, counter)
+        print(f"{name:24} p50 {results[name]['p50_ms']:9.2f} ms  p95 {results[name]['p95_ms']:9.2f} ms  "
+              f"{results[name]['queries']:4d} queries  peak {results[name]['peak_kib']:9.1f} KiB", flush=True)
+    event.remove(engine, "after_cursor_execute", count)
+
+    return {
+        "profile": profile,
+        "cohort": cohort,
+        "iterations": iterations,
+        "python": platform.python_version(),
+        "routes": results,
+    }
+
+
+def compare(report, baseline, latency_tolerance, memory_tolerance):
+    """Print the change per route against a baseline; return the list of regressions."""
+    regressions = []
+    for name, base in baseline["routes"].items():
+        now = report["routes"].get(name)
+        if now is None:
+            continue
+        checks = [
+            ("queries", now["queries"] > base["queries"]),
+            ("p95_ms", now["p95_ms"] > base["p95_ms"] * (1 + latency_tolerance)),
+            ("peak_kib", now["peak_kib"] > base["peak_kib"] * (1 + memory_tolerance)),
+        ]
+        for metric, worse in checks:
+            change = (now[metric] - base[metric]) / base[metric] * 100 if base[metric] else 0.0
+            flag = "  ❌" if worse else ""
+            print(f"{name:24} {metric:9} {base[metric]:>10} -> {now[metric]:>10} ({change:+.0f}%){flag}")
+            if worse:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--route", action="append", choices=sorted(ROUTES), help="only these routes (repeatable)")
+    parser.add_argument("--save", help="write the results as a baseline JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--latency-tolerance", type=float, default=1.0, help="allowed p95 growth (1.0 = 2x)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.5, help="allowed peak memory growth")
+    parser.add_argument("--keep", action="store_true", help=f"keep the database and files in {WORKDIR}")
+    args = parser.parse_args()
+
+    try:
+        report = run(args.profile, args.iterations, args.route)
+    finally:
+        if not args.keep:
+            shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["profile"] != report["profile"]:
+            parser.error(f"baseline is for the {baseline['profile']} profile")
+        regressions = compare(report, baseline, args.latency_tolerance, args.memory_tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
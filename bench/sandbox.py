@@ -0,0 +1,18 @@
+"""
+Point the app at a throwaway SQLite database and storage root. Import this
+before `app`: the database URL and storage folders are read at import time.
+"""
+import os
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="ims-bench-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}",
+    "STORAGE_ROOT": WORKDIR,
+    "JOB_MODE": "inline",
+    "FRAGMENT_CACHE": "memory",
+    "QUERY_PROFILER": "off",
+    "SOCKETIO_ASYNC_MODE": "threading",
+})
+for name in ("SOCKETIO_MESSAGE_QUEUE", "FRAGMENT_CACHE_URL", "PROMETHEUS_MULTIPROC_DIR", "METRICS_TOKEN"):
+    os.environ.pop(name, None)
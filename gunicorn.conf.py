@@ -0,0 +1,44 @@
+# Gunicorn settings for the Socket.IO deployment.
+#
+# Sync workers block on every open websocket, so the app is served through an
+# async worker class instead. Each worker holds its own set of clients and
+# gunicorn does not route a Socket.IO session back to the worker that owns it,
+# so the default is one worker; scale with more processes/containers behind a
+# sticky load balancer and set SOCKETIO_MESSAGE_QUEUE so emits reach clients on
+# the other ones. Only raise WEB_CONCURRENCY if every client is websocket-only.
+import glob
+import os
+import socket
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("WORKER_CLASS", "eventlet")
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+# Idle websocket clients per worker
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", 4000))
+# Long-lived websocket requests must not be killed as stuck workers
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 75
+accesslog = "-"
+
+# Prometheus samples from every worker go to one directory so /metrics on any
+# worker reports the whole server. It must be set before workers import the app.
+# Sample files are named <host>-<pid> (app.metrics_process_id), so the directory
+# can be a volume shared with the jobs container; on start only this host's
+# files from a previous run are removed, so their counters are not merged in.
+# `flask run-jobs` removes its own files when it exits (app.remove_metrics_files),
+# so recreated jobs containers don't leave them behind under old host names.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/ims-metrics")
+HOST = socket.gethostname().replace("_", "-")
+
+
+def on_starting(server):
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, f"*_{HOST}-*.db")):
+        os.remove(stale)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(f"{HOST}-{worker.pid}")